@@ -0,0 +1,217 @@
+import os
+from collections import defaultdict
+from datetime import date, datetime, timezone
+from typing import Sequence
+
+from sqlalchemy import (
+    BigInteger,
+    Boolean,
+    Column,
+    Connection,
+    DateTime,
+    Float,
+    Index,
+    Integer,
+    MetaData,
+    Table,
+    delete,
+    func,
+    insert,
+    select,
+)
+from sqlalchemy.sql import Select
+
+from app.db import engine
+from app.models.transaction import CorpTransaction
+
+ARCHIVE_DIR = "./data/archive"
+ARCHIVE_SCHEMA = "archive"
+
+# The live table's columns minus its surrogate ``id``, addressed inside an ATTACHed partition
+# file. Rows are deduplicated on transaction_id: live ids are reused by SQLite after deletes,
+# so copying them would let a later transaction collide with an archived one.
+_archived = Table(
+    CorpTransaction.__tablename__,
+    MetaData(),
+    Column("transaction_id", BigInteger, nullable=False, unique=True),
+    Column("division", Integer, nullable=False),
+    Column("type_id", Integer, nullable=False),
+    Column("quantity", Integer, nullable=False),
+    Column("is_buy", Boolean, nullable=False),
+    Column("unit_price", Float, nullable=False),
+    Column("date", DateTime, nullable=False),
+    Column("created_at", DateTime, nullable=False),
+    Index("idx_archived_transactions_type_date", "type_id", "date"),
+    schema=ARCHIVE_SCHEMA,
+)
+_ARCHIVED_COLUMNS = [column.name for column in _archived.columns]
+
+
+def partition_path(month: str) -> str:
+    return os.path.join(ARCHIVE_DIR, f"corp_transactions-{month}.db")
+
+
+def _month_start(month: str) -> datetime:
+    year, mon = map(int, month.split("-"))
+    return datetime(year, mon, 1, tzinfo=timezone.utc)
+
+
+def _next_month(month: str) -> str:
+    year, mon = map(int, month.split("-"))
+    return f"{year + mon // 12:04d}-{mon % 12 + 1:02d}"
+
+
+def partition_months(start: datetime, end: datetime) -> list[str]:
+    """Months (YYYY-MM) overlapping [start, end)."""
+    months = []
+    month = f"{start.year:04d}-{start.month:02d}"
+    while _month_start(month).replace(tzinfo=end.tzinfo) < end:
+        months.append(month)
+        month = _next_month(month)
+    return months
+
+
+def _attach(conn: Connection, path: str) -> None:
+    # ATTACH/DETACH cannot run inside a transaction, so callers commit before detaching.
+    conn.exec_driver_sql(f"ATTACH DATABASE ? AS {ARCHIVE_SCHEMA}", (path,))
+
+
+def _detach(conn: Connection) -> None:
+    conn.exec_driver_sql(f"DETACH DATABASE {ARCHIVE_SCHEMA}")
+
+
+def _month_of(value: datetime) -> str:
+    return f"{value.year:04d}-{value.month:02d}"
+
+
+def archive_transactions_before(cutoff: datetime) -> int:
+    """Move live transactions older than ``cutoff`` into their monthly partition files.
+
+    Each month is copied with INSERT OR IGNORE on transaction_id and deleted from the live
+    table in one transaction, and only once every selected row is confirmed present in the
+    partition, so a move that is interrupted can simply be repeated.
+    """
+    live = CorpTransaction.__table__
+    month_of = func.strftime("%Y-%m", live.c.date)
+    with engine.connect() as conn:
+        months = conn.execute(
+            select(month_of).where(live.c.date < cutoff).distinct().order_by(month_of)
+        ).scalars().all()
+        conn.commit()
+    if not months:
+        return 0
+
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    moved = 0
+    with engine.connect() as conn:
+        for month in months:
+            window = (
+                live.c.date >= _month_start(month),
+                live.c.date < min(_month_start(_next_month(month)), cutoff),
+            )
+            _attach(conn, partition_path(month))
+            try:
+                _archived.create(conn, checkfirst=True)
+                conn.execute(
+                    insert(_archived).prefix_with("OR IGNORE").from_select(
+                        _ARCHIVED_COLUMNS, select(*(live.c[name] for name in _ARCHIVED_COLUMNS)).where(*window)
+                    )
+                )
+                selected = conn.execute(select(func.count()).select_from(live).where(*window)).scalar_one()
+                # Rows ignored as already archived (by an earlier interrupted move) count as present.
+                present = conn.execute(
+                    select(func.count()).select_from(live).where(
+                        *window,
+                        live.c.transaction_id.in_(select(_archived.c.transaction_id)),
+                    )
+                ).scalar_one()
+                if present != selected:
+                    conn.rollback()
+                    print(f"[ARCHIVE] {month}: only {present} of {selected} rows archived; keeping them live")
+                    continue
+                moved += conn.execute(delete(live).where(*window)).rowcount or 0
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                _detach(conn)
+    return moved
+
+
+def get_archived_transaction_ids(rows: Sequence[dict]) -> set[int]:
+    """Transaction ids among ``rows`` (column dicts) already moved into a monthly partition."""
+    by_month: dict[str, list[int]] = defaultdict(list)
+    for row in rows:
+        by_month[_month_of(row["date"])].append(row["transaction_id"])
+    months = [month for month in by_month if os.path.exists(partition_path(month))]
+    if not months:
+        return set()
+
+    archived: set[int] = set()
+    with engine.connect() as conn:
+        for month in months:
+            _attach(conn, partition_path(month))
+            try:
+                archived.update(conn.execute(
+                    select(_archived.c.transaction_id).where(_archived.c.transaction_id.in_(by_month[month]))
+                ).scalars())
+                conn.commit()
+            finally:
+                _detach(conn)
+    return archived
+
+
+def archived_months() -> list[str]:
+    """Months (YYYY-MM) that have a partition file, oldest first."""
+    if not os.path.isdir(ARCHIVE_DIR):
+        return []
+    prefix, suffix = "corp_transactions-", ".db"
+    return sorted(
+        name[len(prefix):-len(suffix)]
+        for name in os.listdir(ARCHIVE_DIR)
+        if name.startswith(prefix) and name.endswith(suffix)
+    )
+
+
+def archive_start() -> datetime | None:
+    """Start of the oldest archived month, or None while nothing is archived."""
+    months = archived_months()
+    return _month_start(months[0]) if months else None
+
+
+def _daily_sales_stmt(table: Table, start: datetime, end: datetime) -> Select:
+    day = func.date(table.c.date)
+    return (
+        select(table.c.is_buy, day, table.c.type_id, func.sum(table.c.quantity))
+        .where(table.c.date >= start, table.c.date < end)
+        .group_by(table.c.is_buy, day, table.c.type_id)
+    )
+
+
+def get_daily_sales_between(start: datetime, end: datetime) -> list[tuple[bool, date, int, int]]:
+    """Quantity per (is_buy, UTC day, type_id) over [start, end), live and archived.
+
+    Only the partitions of months overlapping the window are attached. A row lives either
+    in the live table or in one partition, so per-source sums add up without double counting.
+    """
+    totals: dict[tuple[bool, str, int], int] = defaultdict(int)
+    months = [month for month in partition_months(start, end) if os.path.exists(partition_path(month))]
+    with engine.connect() as conn:
+        for is_buy, day, type_id, quantity in conn.execute(
+            _daily_sales_stmt(CorpTransaction.__table__, start, end)
+        ):
+            totals[(is_buy, day, type_id)] += quantity
+        conn.commit()
+        for month in months:
+            _attach(conn, partition_path(month))
+            try:
+                for is_buy, day, type_id, quantity in conn.execute(_daily_sales_stmt(_archived, start, end)):
+                    totals[(is_buy, day, type_id)] += quantity
+                conn.commit()
+            finally:
+                _detach(conn)
+    return [
+        (bool(is_buy), date.fromisoformat(day), type_id, quantity)
+        for (is_buy, day, type_id), quantity in totals.items()
+    ]
@@ -1,10 +1,28 @@
 import json
+import threading
+import time
+from collections import OrderedDict
 from functools import lru_cache
-from typing import Any
+from typing import Any, Callable
 
 import redis
 
 from app.config import settings
+from app.instrumentation import CACHE_LOOKUPS, CACHE_SECONDS, key_namespace
+
+# Writers publish the key they changed here so every process drops its local copy.
+INVALIDATION_CHANNEL = "cache:invalidate"
+
+_MISSING = object()
+
+_local: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+_local_lock = threading.Lock()
+# Bumped on every drop; a read that raced an invalidation must not repopulate the local tier.
+_local_generation = 0
+_subscriber: Any = None
+_subscriber_lock = threading.Lock()
+# Called with each invalidated key (None when everything must be considered stale).
+_invalidation_listeners: list[Callable[[str | None], None]] = []
 
 
 @lru_cache(maxsize=1)
@@ -13,20 +31,141 @@ def get_client() -> redis.Redis:
     return redis.Redis.from_url(settings.redis_url, decode_responses=True)
 
 
-def get_json(key: str) -> Any | None:
-    raw = get_client().get(key)
+def _local_get(key: str) -> Any:
+    with _local_lock:
+        entry = _local.get(key)
+        if entry is None:
+            return _MISSING
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del _local[key]
+            return _MISSING
+        _local.move_to_end(key)
+        return value
+
+
+def _local_put(key: str, value: Any, ttl: float, generation: int) -> None:
+    if ttl <= 0:
+        return
+    with _local_lock:
+        if generation != _local_generation:
+            return
+        _local[key] = (time.monotonic() + ttl, value)
+        _local.move_to_end(key)
+        while len(_local) > settings.local_cache_size:
+            _local.popitem(last=False)
+
+
+def _local_drop(key: str | None = None) -> None:
+    global _local_generation
+    with _local_lock:
+        _local_generation += 1
+        if key is None:
+            _local.clear()
+        else:
+            _local.pop(key, None)
+
+
+def _notify_listeners(key: str | None) -> None:
+    for listener in _invalidation_listeners:
+        try:
+            listener(key)
+        except Exception as exc:
+            print(f"[CACHE] Invalidation listener failed: {exc}", flush=True)
+
+
+def _on_invalidate(message: dict) -> None:
+    _local_drop(message["data"])
+    _notify_listeners(message["data"])
+
+
+def _on_subscriber_error(exc: Exception, pubsub: Any, thread: Any) -> None:
+    global _subscriber
+    print(f"[CACHE] Invalidation subscriber stopped: {exc}", flush=True)
+    thread.stop()
+    # Without invalidations the local tier could go stale; start over once Redis is back.
+    with _subscriber_lock:
+        _subscriber = None
+    _local_drop()
+    _notify_listeners(None)
+
+
+def _ensure_subscriber() -> bool:
+    global _subscriber
+    if _subscriber is not None:
+        return True
+    with _subscriber_lock:
+        if _subscriber is None:
+            try:
+                pubsub = get_client().pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(**{INVALIDATION_CHANNEL: _on_invalidate})
+                _subscriber = pubsub.run_in_thread(
+                    sleep_time=1, daemon=True, exception_handler=_on_subscriber_error
+                )
+            except redis.RedisError as exc:
+                print(f"[CACHE] Local cache disabled; cannot subscribe to invalidations: {exc}", flush=True)
+                return False
+    return True
+
+
+def add_invalidation_listener(listener: Callable[[str | None], None]) -> None:
+    """Call ``listener`` whenever any process writes or deletes a key with invalidation."""
+    _invalidation_listeners.append(listener)
+    _ensure_subscriber()
+
+
+def get_json(key: str, local: bool = True) -> Any | None:
+    """Read and decode a JSON value, serving hot keys from the in-process tier.
+
+    Locally cached values are shared between callers and must be treated as read-only.
+    """
+    start = time.perf_counter()
+    namespace = key_namespace(key)
+    try:
+        value, result = _get_json(key, local)
+    finally:
+        CACHE_SECONDS.labels("get", namespace).observe(time.perf_counter() - start)
+    CACHE_LOOKUPS.labels(namespace, result).inc()
+    return value
+
+
+def _get_json(key: str, local: bool) -> tuple[Any | None, str]:
+    use_local = local and settings.local_cache_ttl_seconds > 0 and _ensure_subscriber()
+    if use_local:
+        value = _local_get(key)
+        if value is not _MISSING:
+            return value, "local_hit"
+        generation = _local_generation
+        # Fetch the remaining Redis TTL in the same round trip so the local copy never outlives it.
+        raw, pttl = get_client().pipeline(transaction=False).get(key).pttl(key).execute()
+    else:
+        raw, pttl = get_client().get(key), -1
     if raw is None:
-        return None
+        return None, "miss"
     try:
-        return json.loads(raw)
+        value = json.loads(raw)
     except json.JSONDecodeError:
-        return None
+        return None, "miss"
+
+    if use_local:
+        ttl = settings.local_cache_ttl_seconds
+        if pttl is not None and pttl >= 0:
+            ttl = min(ttl, pttl / 1000)
+        _local_put(key, value, ttl, generation)
+    return value, "hit"
 
 
-def set_json(key: str, value: Any, ex: int | None = None) -> None:
+def set_json(key: str, value: Any, ex: int | None = None, local: bool = True) -> None:
+    start = time.perf_counter()
     payload = json.dumps(value)
     get_client().set(key, payload, ex=ex)
+    if local:
+        _local_drop(key)
+        get_client().publish(INVALIDATION_CHANNEL, key)
+    CACHE_SECONDS.labels("set", key_namespace(key)).observe(time.perf_counter() - start)
 
 
 def delete(key: str) -> None:
     get_client().delete(key)
+    _local_drop(key)
+    get_client().publish(INVALIDATION_CHANNEL, key)
@@ -8,6 +8,10 @@ class Settings(BaseSettings):
     eve_callback_url: str = "http://localhost:8000/callback"
 
     esi_client_useragent: str = "lumacorp-api/0.1.1"
+    esi_base_url: str = "https://esi.evetech.net/latest"
+    esi_max_connections: int = 20
+    esi_max_concurrency: int = 16
+    esi_timeout_seconds: float = 30
     scopes: list[str] = [
         "esi-wallet.read_corporation_wallets.v1",
         "esi-corporations.read_divisions.v1",
@@ -18,17 +22,29 @@ class Settings(BaseSettings):
     database_url: str = "sqlite:///./data/lumacorp.db"
     refresh_token_secret: str
 
-    character_id: str | None = None
     corp_id: str | None = None
     region_id: int = 10000043
+    region_ids: list[int] = []
     avg_daily_volume_window: int = 5
     max_profit_indexes: int = 50
     min_profit_threshold: float = 10000000
+    profit_price_tolerance: float = 0.001
+    order_book_cache_size: int = 8
+    order_book_shared: bool = True
     profit_refresh_seconds: int = 24 * 60 * 60
     wallet_refresh_seconds: int = 5 * 60
     corp_sales_refresh_seconds: int = 10 * 60
     corp_sales_window_days: int = 5
+    corp_sales_batch_size: int = 1000
+    metrics_max_age_seconds: int = 60
+    metrics_live_max_age_seconds: float = 10
+    leader_election: bool = True
+    leader_lease_seconds: float = 30
+    job_lock_lease_seconds: float = 60
+    admin_token: str | None = None
     redis_url: str = "redis://localhost:6379/0"
+    local_cache_ttl_seconds: float = 30
+    local_cache_size: int = 256
     
     class Config:
         case_sensitive = False
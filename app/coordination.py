@@ -0,0 +1,174 @@
+import asyncio
+import os
+import socket
+import time
+import uuid
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Awaitable, Callable, Optional
+
+import redis
+
+from app.cache import get_client
+from app.config import settings
+
+LEADER_KEY = "scheduler:leader"
+JOB_LOCK_PREFIX = "scheduler:job"
+JOB_LAST_RUN_PREFIX = "scheduler:last_run"
+
+INSTANCE_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+# Compare-and-act so a replica can only extend or drop a lease it still owns.
+_RENEW_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('pexpire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+_RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+class LeaseLost(RuntimeError):
+    """The block holding a lease was stopped because the lease could not be renewed."""
+
+
+class Lease:
+    """A Redis key owned by one holder until released, or until its TTL lapses without renewal."""
+
+    def __init__(self, key: str, ttl_seconds: float, token: Optional[str] = None):
+        self.key = key
+        self.ttl_seconds = ttl_seconds
+        self.token = token or f"{INSTANCE_ID}:{uuid.uuid4().hex[:8]}"
+        self.lost = False
+
+    def acquire(self) -> bool:
+        return bool(get_client().set(self.key, self.token, nx=True, px=int(self.ttl_seconds * 1000)))
+
+    def renew(self) -> bool:
+        return bool(get_client().eval(_RENEW_SCRIPT, 1, self.key, self.token, int(self.ttl_seconds * 1000)))
+
+    def release(self) -> None:
+        get_client().eval(_RELEASE_SCRIPT, 1, self.key, self.token)
+
+
+async def _keep_renewed(lease: Lease, holder: asyncio.Task) -> None:
+    expires_at = time.monotonic() + lease.ttl_seconds
+    while True:
+        await asyncio.sleep(lease.ttl_seconds / 3)
+        attempted_at = time.monotonic()
+        try:
+            held = await asyncio.to_thread(lease.renew)
+        except redis.RedisError as exc:
+            # Keep retrying while the next attempt can still land before the key expires.
+            if attempted_at + lease.ttl_seconds / 3 < expires_at:
+                print(f"[LEADER] Renewing {lease.key} failed: {exc}; retrying", flush=True)
+                continue
+            held = False
+        if held:
+            expires_at = attempted_at + lease.ttl_seconds
+        else:
+            # Another replica may own the key by now; stop the holder rather than run unguarded.
+            print(f"[LEADER] Lost lease {lease.key}; cancelling its holder", flush=True)
+            lease.lost = True
+            holder.cancel()
+            return
+
+
+@asynccontextmanager
+async def job_lock(name: str) -> AsyncIterator[bool]:
+    """Hold the job's lease (renewed in the background) for the duration of the block.
+
+    Yields False without running anything when another replica holds it. If a renewal
+    fails the block is cancelled and LeaseLost raised; work already handed to threads
+    runs on, but nothing awaiting after the loss does.
+    """
+    lease = Lease(f"{JOB_LOCK_PREFIX}:{name}", settings.job_lock_lease_seconds)
+    if not await asyncio.to_thread(lease.acquire):
+        yield False
+        return
+
+    holder = asyncio.current_task()
+    renewer = asyncio.create_task(_keep_renewed(lease, holder))
+    try:
+        yield True
+    except asyncio.CancelledError:
+        if not lease.lost:
+            raise
+        holder.uncancel()
+        raise LeaseLost(f"Lease {lease.key} lost while '{name}' was running") from None
+    finally:
+        renewer.cancel()
+        await asyncio.to_thread(lease.release)
+
+
+def record_job_run(name: str) -> None:
+    get_client().set(f"{JOB_LAST_RUN_PREFIX}:{name}", time.time())
+
+
+def get_job_last_run(name: str) -> Optional[float]:
+    value = get_client().get(f"{JOB_LAST_RUN_PREFIX}:{name}")
+    return float(value) if value is not None else None
+
+
+class LeaderElector:
+    """Keeps at most one replica marked as leader through a renewed Redis lease.
+
+    With election disabled every process considers itself the leader, as a single
+    deployment always did.
+    """
+
+    def __init__(self):
+        self.lease = Lease(LEADER_KEY, settings.leader_lease_seconds, token=INSTANCE_ID)
+        self.is_leader = not settings.leader_election
+        self._task: Optional[asyncio.Task] = None
+        self._on_elected: Optional[Callable[[], Awaitable[None]]] = None
+
+    async def _attempt(self) -> None:
+        try:
+            held = await asyncio.to_thread(self.lease.renew if self.is_leader else self.lease.acquire)
+        except redis.RedisError as exc:
+            print(f"[LEADER] Election unavailable: {exc}", flush=True)
+            held = False
+
+        elected = held and not self.is_leader
+        if held != self.is_leader:
+            print(f"[LEADER] {INSTANCE_ID} {'acquired' if held else 'lost'} leadership", flush=True)
+        self.is_leader = held
+        if elected and self._on_elected is not None:
+            await self._on_elected()
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.lease.ttl_seconds / 3)
+            await self._attempt()
+
+    async def start(self, on_elected: Optional[Callable[[], Awaitable[None]]] = None) -> None:
+        """Make the first attempt before returning, then keep campaigning in the background."""
+        if not settings.leader_election:
+            return
+        self._on_elected = on_elected
+        await self._attempt()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if settings.leader_election and self.is_leader:
+            self.is_leader = False
+            # Hand over right away instead of making the next leader wait out the lease.
+            try:
+                await asyncio.to_thread(self.lease.release)
+            except redis.RedisError:
+                pass
+
+
+elector = LeaderElector()
+
+
+def is_leader() -> bool:
+    return elector.is_leader
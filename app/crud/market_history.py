@@ -0,0 +1,70 @@
+from datetime import date, datetime
+from typing import Iterable
+
+from sqlalchemy import func, select
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session
+
+from app.models.market_history import MarketHistory, MarketHistorySync
+
+
+def get_latest_history_dates(db: Session, region_id: int, type_ids: Iterable[int]) -> dict[int, date]:
+    stmt = (
+        select(MarketHistory.type_id, func.max(MarketHistory.date))
+        .where(
+            MarketHistory.region_id == region_id,
+            MarketHistory.type_id.in_(list(type_ids)),
+        )
+        .group_by(MarketHistory.type_id)
+    )
+    return {type_id: latest for type_id, latest in db.execute(stmt).all()}
+
+
+def get_history_synced_at(db: Session, region_id: int, type_ids: Iterable[int]) -> dict[int, datetime]:
+    stmt = select(MarketHistorySync.type_id, MarketHistorySync.synced_at).where(
+        MarketHistorySync.region_id == region_id,
+        MarketHistorySync.type_id.in_(list(type_ids)),
+    )
+    return {type_id: synced_at for type_id, synced_at in db.execute(stmt).all()}
+
+
+def mark_history_synced(db: Session, region_id: int, type_ids: Iterable[int], synced_at: datetime) -> None:
+    rows = [dict(region_id=region_id, type_id=type_id, synced_at=synced_at) for type_id in type_ids]
+    if not rows:
+        return
+
+    stmt = insert(MarketHistorySync)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[MarketHistorySync.region_id, MarketHistorySync.type_id],
+        set_=dict(synced_at=stmt.excluded.synced_at),
+    )
+    db.execute(stmt, rows)
+    db.commit()
+
+
+def insert_history(db: Session, rows: list[dict]) -> int:
+    """Insert history rows, ignoring days already stored."""
+    if not rows:
+        return 0
+
+    stmt = insert(MarketHistory).prefix_with("OR IGNORE")
+    db.execute(stmt, rows)
+    db.commit()
+    return len(rows)
+
+
+def get_volume_sums_between(
+    db: Session, region_id: int, start: date, end: date, type_ids: Iterable[int]
+) -> dict[int, int]:
+    """Total traded volume per type for days in [start, end)."""
+    stmt = (
+        select(MarketHistory.type_id, func.sum(MarketHistory.volume))
+        .where(
+            MarketHistory.region_id == region_id,
+            MarketHistory.type_id.in_(list(type_ids)),
+            MarketHistory.date >= start,
+            MarketHistory.date < end,
+        )
+        .group_by(MarketHistory.type_id)
+    )
+    return {type_id: total for type_id, total in db.execute(stmt).all()}
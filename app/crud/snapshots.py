@@ -0,0 +1,32 @@
+from datetime import datetime, timezone
+
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session
+
+from app.models.snapshot import SnapshotCheckpoint
+
+
+def save_checkpoint(db: Session, key: str, payload: str, ttl_seconds: int | None = None) -> None:
+    stmt = insert(SnapshotCheckpoint).values(
+        key=key,
+        version=1,
+        updated_at=datetime.now(timezone.utc),
+        ttl_seconds=ttl_seconds,
+        payload=payload,
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[SnapshotCheckpoint.key],
+        set_=dict(
+            version=SnapshotCheckpoint.version + 1,
+            updated_at=stmt.excluded.updated_at,
+            ttl_seconds=stmt.excluded.ttl_seconds,
+            payload=stmt.excluded.payload,
+        ),
+    )
+    db.execute(stmt)
+    db.commit()
+
+
+def get_checkpoints(db: Session) -> list[SnapshotCheckpoint]:
+    return list(db.execute(select(SnapshotCheckpoint)).scalars())
@@ -2,8 +2,12 @@ from sqlalchemy.orm import Session
 from app.models.token import RefreshToken
 from app.utils.encrypt import encrypt, decrypt
 
-def get_refresh_token(db: Session):
-    token = db.query(RefreshToken).first()
+def get_refresh_token_character_ids(db: Session) -> list[str]:
+    rows = db.query(RefreshToken.character_id).order_by(RefreshToken.id).all()
+    return [str(character_id) for character_id, in rows if character_id]
+
+def get_refresh_token(db: Session, character_id: str):
+    token = db.query(RefreshToken).filter(RefreshToken.character_id == str(character_id)).first()
     if token:
         token.refresh_token = decrypt(token.refresh_token)
     return token
@@ -11,12 +15,10 @@ def get_refresh_token(db: Session):
 def save_refresh_token(db: Session, refresh_token: str, character_id: str):
     encrypted_token = encrypt(refresh_token)
 
-    token = get_refresh_token(db)
+    token = db.query(RefreshToken).filter(RefreshToken.character_id == str(character_id)).first()
     if token:
         token.refresh_token = encrypted_token
-        token.character_id = character_id
     else:
-        token = RefreshToken(id=1, refresh_token=encrypted_token, character_id=character_id)
+        token = RefreshToken(refresh_token=encrypted_token, character_id=str(character_id))
         db.add(token)
     db.commit()
-    
\ No newline at end of file
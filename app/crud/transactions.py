@@ -1,11 +1,13 @@
-from datetime import datetime
-from typing import Iterable, Sequence
+from collections import defaultdict
+from datetime import date, datetime, timedelta, timezone
+from typing import Sequence
 
-from sqlalchemy import func, select, delete
+from sqlalchemy import func, select
 from sqlalchemy.dialects.sqlite import insert
 from sqlalchemy.orm import Session
 
-from app.models.transaction import CorpTransaction
+from app.archive import archive_start, get_archived_transaction_ids, get_daily_sales_between
+from app.models.transaction import CorpIngestCursor, CorpSalesDaily, CorpTransaction
 
 
 def get_latest_transaction_id(db: Session, division: int) -> int | None:
@@ -16,51 +18,95 @@ def get_latest_transaction_id(db: Session, division: int) -> int | None:
     return result
 
 
-def upsert_transactions(db: Session, txns: Iterable[CorpTransaction]) -> int:
-    """Insert transactions, ignoring duplicates by transaction_id."""
-    tx_dicts = [
-        dict(
-            transaction_id=txn.transaction_id,
-            division=txn.division,
-            type_id=txn.type_id,
-            quantity=txn.quantity,
-            is_buy=txn.is_buy,
-            unit_price=txn.unit_price,
-            date=txn.date,
-        )
-        for txn in txns
-    ]
+def get_ingest_cursor(db: Session, division: int) -> int | None:
+    cursor = db.get(CorpIngestCursor, division)
+    if cursor is not None:
+        return cursor.last_seen_id
+    # Databases from before cursors existed fall back to the newest stored row.
+    return get_latest_transaction_id(db, division)
+
+
+def set_ingest_cursor(db: Session, division: int, last_seen_id: int) -> None:
+    stmt = insert(CorpIngestCursor).values(division=division, last_seen_id=last_seen_id)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[CorpIngestCursor.division],
+        set_=dict(last_seen_id=func.max(CorpIngestCursor.last_seen_id, stmt.excluded.last_seen_id)),
+    )
+    db.execute(stmt)
+    db.commit()
+
+
+def upsert_transactions(db: Session, tx_dicts: Sequence[dict]) -> int:
+    """Insert transaction rows (column dicts), ignoring duplicates by transaction_id, live or archived.
+
+    The daily rollup is bumped for the genuinely new rows in the same transaction.
+    """
     if not tx_dicts:
         return 0
 
-    stmt = insert(CorpTransaction).prefix_with("OR IGNORE")
-    result = db.execute(stmt, tx_dicts)
-    db.commit()
-    try:
-        count = result.rowcount  # may be None for some dialects
-        if count is None or count < 0:
-            raise AttributeError
-        return count
-    except AttributeError:
-        return len(tx_dicts)
-
-
-def prune_transactions_before(db: Session, cutoff: datetime) -> int:
-    stmt = delete(CorpTransaction).where(CorpTransaction.date < cutoff)
-    result = db.execute(stmt)
+    existing = set(db.execute(
+        select(CorpTransaction.transaction_id).where(
+            CorpTransaction.transaction_id.in_([txn["transaction_id"] for txn in tx_dicts])
+        )
+    ).scalars())
+    # A re-walked journal can return rows already moved to the archive; they are counted already.
+    existing |= get_archived_transaction_ids(tx_dicts)
+    new_rows = [txn for txn in tx_dicts if txn["transaction_id"] not in existing]
+    if not new_rows:
+        return 0
+
+    db.execute(insert(CorpTransaction).prefix_with("OR IGNORE"), new_rows)
+    _add_to_sales_rollup(db, new_rows)
     db.commit()
-    return result.rowcount or 0
+    return len(new_rows)
+
+
+def _add_to_sales_rollup(db: Session, tx_dicts: Sequence[dict]) -> None:
+    totals: dict[tuple[bool, date, int], int] = defaultdict(int)
+    for txn in tx_dicts:
+        totals[(txn["is_buy"], txn["date"].date(), txn["type_id"])] += txn["quantity"]
+
+    stmt = insert(CorpSalesDaily)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[CorpSalesDaily.is_buy, CorpSalesDaily.day, CorpSalesDaily.type_id],
+        set_=dict(quantity=CorpSalesDaily.quantity + stmt.excluded.quantity),
+    )
+    db.execute(stmt, [
+        dict(is_buy=is_buy, day=day, type_id=type_id, quantity=quantity)
+        for (is_buy, day, type_id), quantity in totals.items()
+    ])
+
+
+def ensure_sales_rollup(db: Session) -> None:
+    """Backfill the rollup from raw rows, live and archived, when it is empty (e.g. right after it was introduced)."""
+    if db.execute(select(CorpSalesDaily.type_id).limit(1)).first() is not None:
+        return
+
+    # Archived months are always older than anything still live.
+    start = archive_start() or db.execute(select(func.min(CorpTransaction.date))).scalar()
+    if start is None:
+        return
+
+    rows = get_daily_sales_between(start, datetime.now(timezone.utc) + timedelta(days=1))
+    if rows:
+        db.execute(insert(CorpSalesDaily), [
+            dict(is_buy=is_buy, day=day, type_id=type_id, quantity=quantity)
+            for is_buy, day, type_id, quantity in rows
+        ])
+        db.commit()
 
 
-def get_sales_sums_since(
-    db: Session, since: datetime
+def get_daily_sales_sums_between(
+    db: Session, start: date, end: date
 ) -> Sequence[tuple[int, int]]:
+    """Sold quantity per type for UTC days in [start, end)."""
     stmt = (
-        select(CorpTransaction.type_id, func.sum(CorpTransaction.quantity))
+        select(CorpSalesDaily.type_id, func.sum(CorpSalesDaily.quantity))
         .where(
-            CorpTransaction.is_buy.is_(False),
-            CorpTransaction.date >= since,
+            CorpSalesDaily.is_buy.is_(False),
+            CorpSalesDaily.day >= start,
+            CorpSalesDaily.day < end,
         )
-        .group_by(CorpTransaction.type_id)
+        .group_by(CorpSalesDaily.type_id)
     )
     return db.execute(stmt).all()
@@ -1,18 +1,54 @@
-from typing import Optional
+import asyncio
+import json
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Any, Callable, Coroutine, Optional
 
+import httpx
+import redis.asyncio as aioredis
 from preston import Preston
 from sqlalchemy.orm import Session
 
+from app import cache
 from app.config import settings
-from app.crud.token import get_refresh_token, save_refresh_token
+from app.crud.token import get_refresh_token, get_refresh_token_character_ids, save_refresh_token
 from app.db import SessionLocal
+from app.snapshots import store_snapshot
+from app.instrumentation import (
+    CACHE_SECONDS,
+    ESI_REQUEST_SECONDS,
+    ESI_RESPONSE_BYTES,
+    ESI_RESPONSE_CACHE,
+    ESI_RESPONSES,
+    key_namespace,
+)
+from app.tokens import TokenManager
+
+
+# character_id -> corporation_id of every pooled character, for processes that hold no clients.
+PRINCIPALS_KEY = "esi:principals"
+
+
+def _persist_refresh_token(character_id: str, refresh_token: str) -> None:
+    with SessionLocal() as db:
+        save_refresh_token(db, refresh_token, character_id)
 
 
 class EsiClientManager:
+    """Pool of authenticated Preston clients, one per character with a stored refresh token.
+
+    Each client keeps its own token lifecycle in the token manager; corporation calls are
+    made with the token of a pooled character that belongs to the corporation.
+    """
+
     def __init__(self):
-        self._esi: Optional[Preston] = None
+        self.tokens = TokenManager(_persist_refresh_token)
+        self._corporations: dict[str, int] = {}
+        self._lock = threading.Lock()
 
     def _create_client(self, refresh_token: Optional[str] = None) -> Preston:
+        # Tokens are exchanged and persisted by the token manager, not inside Preston.
         client = Preston(
             client_id=settings.eve_client_id,
             client_secret=settings.eve_client_secret,
@@ -20,64 +56,401 @@ class EsiClientManager:
             user_agent=settings.esi_client_useragent,
             scope=" ".join(settings.scopes),
             refresh_token=refresh_token,
-            refresh_token_callback=self._on_refresh_token,
+            no_update_token=True,
         )
         return client
 
-    def _on_refresh_token(self, preston: Preston) -> None:
-        info = preston.whoami()
-        character_id = info.get("character_id")
-        new_rt = preston.refresh_token
-        if character_id is not None and new_rt is not None:
+    def _add_client(self, character_id: str, client: Preston) -> None:
+        corporation_id = esi_async.run(esi_async.get_op(
+            "get_characters_character_id_corporationhistory",
+            character_id=character_id,
+        ))[0]["corporation_id"]
+        self.tokens.add(character_id, client)
+        self._corporations[character_id] = corporation_id
+        store_snapshot(PRINCIPALS_KEY, self._corporations)
+
+    def load_clients(self) -> dict[str, int]:
+        """Pool a client for every stored token not seen yet; returns character -> corporation."""
+        with self._lock:
             with SessionLocal() as db:
-                save_refresh_token(db, new_rt, character_id)
+                # Only rows for characters not pooled yet are decrypted.
+                new_ids = [c for c in get_refresh_token_character_ids(db) if c not in self.tokens]
+                tokens = [get_refresh_token(db, character_id) for character_id in new_ids]
+            for token in tokens:
+                self._add_client(str(token.character_id), self._create_client(token.refresh_token))
+            return dict(self._corporations)
 
-    def get_client(self) -> Preston:
-        if self._esi is None:
-            token = self._load_refresh_token()
-            self._esi = self._create_client(token.refresh_token if token else None)
+    def characters(self) -> list[str]:
+        return list(self._corporations)
 
-            if token and token.character_id:
-                settings.character_id = token.character_id
-                corp = self._esi.get_op(
-                    "get_characters_character_id_corporationhistory",
-                    character_id=token.character_id,
-                )[0]["corporation_id"]
-                settings.corp_id = corp
+    def corporations(self) -> dict[int, list[str]]:
+        """Pooled characters per corporation, falling back to the mapping another process published."""
+        principals = self._corporations or cache.get_json(PRINCIPALS_KEY) or {}
+        by_corp: dict[int, list[str]] = {}
+        for character_id, corporation_id in principals.items():
+            by_corp.setdefault(int(corporation_id), []).append(character_id)
+        return by_corp
 
-        return self._esi
+    def _resolve_character(self, character_id: Optional[str], corporation_id: Optional[int]) -> Optional[str]:
+        if character_id is not None:
+            return str(character_id) if str(character_id) in self.tokens else None
+        if corporation_id is not None:
+            members = self.corporations().get(int(corporation_id), [])
+            return next((c for c in members if c in self.tokens), None)
+        return next(iter(self._corporations), None)
 
-    def _load_refresh_token(self):
-        with SessionLocal() as db:
-            return get_refresh_token(db)
+    def get_access_token(
+        self, character_id: Optional[str] = None, corporation_id: Optional[int] = None, block: bool = True
+    ) -> Optional[str]:
+        """Access token for the character, or for a pooled member of the corporation.
 
-    def _save_refresh_token(self, refresh_token: str, character_id: int):
-        with SessionLocal() as db:
-            save_refresh_token(db, refresh_token, character_id)
+        With ``block=False`` only an already valid cached token is returned, so callers on an
+        event loop can skip the thread hop; ``None`` means the blocking path is needed.
+        """
+        if not block:
+            resolved = self._resolve_character(character_id, corporation_id)
+            return self.tokens.peek(resolved) if resolved else None
+        if not self._corporations:
+            self.load_clients()
+        resolved = self._resolve_character(character_id, corporation_id)
+        return self.tokens.access_token(resolved) if resolved else None
 
     def get_auth_url(self) -> str:
-        return self.get_client().get_authorize_url()
+        return self._create_client().get_authorize_url()
 
     def authenticate(self, code: str):
-        new_esi = self.get_client().authenticate(code)
-        self._esi = new_esi
+        new_esi = self._create_client().authenticate(code)
 
         info = new_esi.whoami()
         cid = info.get("character_id")
         if cid is None:
             raise RuntimeError("Failed to retrieve character_id from whoami()")
 
-        settings.character_id = cid
-
-        corp = new_esi.get_op(
-            "get_characters_character_id_corporationhistory", character_id=cid
-        )[0]["corporation_id"]
-        settings.corp_id = corp
-
         rt = new_esi.refresh_token
         if rt is None:
             raise RuntimeError("Authenticate did not return a refresh token")
 
-        self._save_refresh_token(rt, cid)
+        _persist_refresh_token(str(cid), rt)
+        with self._lock:
+            # A re-login replaces the character's previous client.
+            self._add_client(str(cid), new_esi)
+
+    def close(self) -> None:
+        self.tokens.close()
 
 esi_manager = EsiClientManager()
+
+
+# Operation id -> (path template, requires auth). Mirrors the Preston operation ids used across the app.
+ESI_OPERATIONS: dict[str, tuple[str, bool]] = {
+    "get_markets_region_id_orders": ("/markets/{region_id}/orders/", False),
+    "get_markets_region_id_history": ("/markets/{region_id}/history/", False),
+    "get_characters_character_id_corporationhistory": ("/characters/{character_id}/corporationhistory/", False),
+    "get_characters_character_id_skills": ("/characters/{character_id}/skills/", True),
+    "get_corporations_corporation_id_blueprints": ("/corporations/{corporation_id}/blueprints/", True),
+    "get_corporations_corporation_id_divisions": ("/corporations/{corporation_id}/divisions/", True),
+    "get_corporations_corporation_id_wallets": ("/corporations/{corporation_id}/wallets/", True),
+    "get_corporations_corporation_id_wallets_division_transactions": (
+        "/corporations/{corporation_id}/wallets/{division}/transactions/",
+        True,
+    ),
+}
+
+# Back off once ESI's error budget gets this low instead of risking a temporary ban.
+ESI_ERROR_LIMIT_FLOOR = 10
+# Transport errors, truncated bodies and these statuses are retried with exponential backoff (1s, 2s, 4s).
+ESI_MAX_ATTEMPTS = 4
+ESI_RETRY_BACKOFF = 1.0
+ESI_RETRY_STATUSES = {500, 502, 503, 504}
+# Rate limited (420 is ESI's error limit); retried once the advertised reset has passed.
+ESI_THROTTLE_STATUSES = {420, 429}
+
+ESI_RESPONSE_CACHE_PREFIX = "esi:response"
+# Keep entries past Expires so the ETag can still be revalidated with a cheap 304.
+ESI_ETAG_RETENTION = 24 * 60 * 60
+# Response headers callers read back from cached entries.
+ESI_CACHED_HEADERS = ("ETag", "Expires", "Last-Modified", "X-Pages")
+# Full market history series are large, fetched at most daily per type and kept in SQLite already.
+ESI_UNCACHED_OPERATIONS = {"get_markets_region_id_history"}
+
+
+def _parse_expires(value: Optional[str]) -> float:
+    if not value:
+        return 0
+    try:
+        return parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError):
+        return 0
+
+
+class EsiResponseCache:
+    """Redis-backed conditional request cache keyed by operation and parameters.
+
+    Fresh entries (before ``Expires``) are served without touching the network; stale
+    entries are revalidated with ``If-None-Match`` so ESI can answer 304 Not Modified.
+    Entries are hashes holding the raw body bytes next to the headers, read and written
+    with the asyncio Redis client so cache I/O never blocks the ESI loop.
+    """
+
+    def __init__(self):
+        self._stats = {"hit": 0, "not_modified": 0, "miss": 0}
+        self._stats_lock = threading.Lock()
+        self._redis: Optional[aioredis.Redis] = None
+
+    @staticmethod
+    def key(op: str, params: dict[str, Any]) -> str:
+        return f"{ESI_RESPONSE_CACHE_PREFIX}:{op}:{json.dumps(params, sort_keys=True, default=str)}"
+
+    def _get_redis(self) -> aioredis.Redis:
+        # Created on first use so it binds to the ESI client loop.
+        if self._redis is None:
+            self._redis = aioredis.Redis.from_url(settings.redis_url)
+        return self._redis
+
+    def count(self, op: str, outcome: str) -> None:
+        ESI_RESPONSE_CACHE.labels(op, outcome).inc()
+        with self._stats_lock:
+            self._stats[outcome] += 1
+
+    def stats(self) -> dict[str, int]:
+        with self._stats_lock:
+            return dict(self._stats)
+
+    async def load(self, key: str) -> Optional[dict]:
+        start = time.perf_counter()
+        try:
+            raw = await self._get_redis().hgetall(key)
+        finally:
+            CACHE_SECONDS.labels("get", key_namespace(key)).observe(time.perf_counter() - start)
+        if b"body" not in raw:
+            return None
+        return {"headers": json.loads(raw[b"headers"]), "expires": float(raw[b"expires"]), "body": raw[b"body"]}
+
+    async def store(self, key: str, response: httpx.Response, previous: Optional[dict] = None) -> dict:
+        # A 304 only refreshes validators and Expires; the body and paging come from the previous entry.
+        headers = dict(previous["headers"]) if previous else {}
+        headers.update({name: response.headers[name] for name in ESI_CACHED_HEADERS if name in response.headers})
+        entry = {
+            "headers": headers,
+            "expires": _parse_expires(headers.get("Expires")),
+            "body": previous["body"] if previous else response.content,
+        }
+        fields = {"headers": json.dumps(headers), "expires": repr(entry["expires"])}
+        if not previous:
+            fields["body"] = entry["body"]
+        ttl = max(int(entry["expires"] - time.time()), 0) + ESI_ETAG_RETENTION
+        start = time.perf_counter()
+        try:
+            async with self._get_redis().pipeline(transaction=True) as pipe:
+                pipe.hset(key, mapping=fields)
+                pipe.expire(key, ttl)
+                await pipe.execute()
+        finally:
+            CACHE_SECONDS.labels("set", key_namespace(key)).observe(time.perf_counter() - start)
+        return entry
+
+    def is_fresh(self, entry: dict) -> bool:
+        return entry["expires"] > time.time()
+
+    async def close(self) -> None:
+        if self._redis is not None:
+            await self._redis.aclose()
+            self._redis = None
+
+
+class EsiResponse:
+    def __init__(self, data: Any, headers: httpx.Headers, status_code: int):
+        self.data = data
+        self.headers = headers
+        self.status_code = status_code
+
+    @property
+    def pages(self) -> int:
+        return int(self.headers.get("X-Pages", 1))
+
+
+class AsyncEsiClient:
+    """Asyncio ESI client with a pooled keep-alive connection set and bounded concurrency.
+
+    The client owns a private event loop on a daemon thread so both sync code running in
+    executor threads (``run``) and coroutines on the app loop (``submit``) can share one pool.
+    """
+
+    def __init__(self, token_provider: Callable[..., Optional[str]]):
+        self._token_provider = token_provider
+        self.response_cache = EsiResponseCache()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._http: Optional[httpx.AsyncClient] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        # Monotonic time before which no request may be sent; shared by every request on the loop.
+        self._resume_at = 0.0
+        self._start_lock = threading.Lock()
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        with self._start_lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="esi-async", daemon=True).start()
+                self._loop = loop
+            return self._loop
+
+    def run(self, coro: Coroutine) -> Any:
+        """Run a coroutine on the client loop and block until it completes."""
+        return asyncio.run_coroutine_threadsafe(coro, self._ensure_loop()).result()
+
+    async def submit(self, coro: Coroutine) -> Any:
+        """Await a coroutine on the client loop from another event loop."""
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, self._ensure_loop()))
+
+    def _get_http(self) -> httpx.AsyncClient:
+        if self._http is None:
+            self._http = httpx.AsyncClient(
+                base_url=settings.esi_base_url,
+                headers={"User-Agent": settings.esi_client_useragent, "Accept": "application/json"},
+                limits=httpx.Limits(
+                    max_connections=settings.esi_max_connections,
+                    max_keepalive_connections=settings.esi_max_connections,
+                ),
+                timeout=settings.esi_timeout_seconds,
+            )
+            self._semaphore = asyncio.Semaphore(settings.esi_max_concurrency)
+        return self._http
+
+    async def _auth_headers(self, params: dict[str, Any]) -> dict[str, str]:
+        # The token belongs to the character (or a member of the corporation) being queried.
+        principal = params.get("character_id"), params.get("corporation_id")
+        token = self._token_provider(*principal, block=False)
+        if token is None:
+            # Refreshes go through Preston's blocking session; keep them off the client loop.
+            token = await asyncio.to_thread(self._token_provider, *principal)
+        if not token:
+            raise RuntimeError("ESI operation requires authentication but no access token is available")
+        return {"Authorization": f"Bearer {token}"}
+
+    async def request(self, op: str, _cache: bool = True, **params: Any) -> EsiResponse:
+        template, authed = ESI_OPERATIONS[op]
+        path_keys = {key for key in params if "{" + key + "}" in template}
+        path = template.format(**{key: params[key] for key in path_keys})
+        query = {key: value for key, value in params.items() if key not in path_keys and value is not None}
+
+        cacheable = _cache and op not in ESI_UNCACHED_OPERATIONS
+        cache_key = self.response_cache.key(op, params) if cacheable else None
+        entry = await self.response_cache.load(cache_key) if cache_key else None
+        if entry and self.response_cache.is_fresh(entry):
+            self.response_cache.count(op, "hit")
+            return EsiResponse(json.loads(entry["body"]), httpx.Headers(entry["headers"]), 200)
+
+        headers = await self._auth_headers(params) if authed else {}
+        if entry and "ETag" in entry["headers"]:
+            headers["If-None-Match"] = entry["headers"]["ETag"]
+
+        response, data = await self._send(op, path, query, headers)
+        if response.status_code == 304 and entry:
+            self.response_cache.count(op, "not_modified")
+            entry = await self.response_cache.store(cache_key, response, previous=entry)
+            return EsiResponse(json.loads(entry["body"]), httpx.Headers(entry["headers"]), 200)
+
+        if cache_key:
+            self.response_cache.count(op, "miss")
+            await self.response_cache.store(cache_key, response)
+        return EsiResponse(data, response.headers, response.status_code)
+
+    def _note_error_budget(self, response: httpx.Response) -> None:
+        remain = response.headers.get("X-ESI-Error-Limit-Remain")
+        throttled = response.status_code in ESI_THROTTLE_STATUSES
+        if not throttled and (remain is None or int(remain) >= ESI_ERROR_LIMIT_FLOOR):
+            return
+        reset = int(response.headers.get("X-ESI-Error-Limit-Reset") or response.headers.get("Retry-After") or 1)
+        resume_at = time.monotonic() + reset
+        if resume_at > self._resume_at:
+            self._resume_at = resume_at
+            print(f"[ESI] Error limit low ({remain} left); pausing all requests {reset}s", flush=True)
+
+    async def _send(
+        self, op: str, path: str, query: dict[str, Any], headers: dict[str, str]
+    ) -> tuple[httpx.Response, Any]:
+        """GET with retries; returns the response and its decoded body (None for 304).
+
+        Client errors raise immediately; transport errors, 5xx and undecodable bodies are retried.
+        """
+        http = self._get_http()
+        for attempt in range(ESI_MAX_ATTEMPTS):
+            last_attempt = attempt == ESI_MAX_ATTEMPTS - 1
+            async with self._semaphore:
+                # Checked after queueing too, so requests already waiting honour a new pause.
+                while (delay := self._resume_at - time.monotonic()) > 0:
+                    await asyncio.sleep(delay)
+                start = time.perf_counter()
+                try:
+                    response = await http.get(path, params=query, headers=headers)
+                except httpx.TransportError as exc:
+                    # Timeouts, refused or dropped connections and protocol errors are all transient.
+                    ESI_RESPONSES.labels(op, "timeout" if isinstance(exc, httpx.TimeoutException) else "error").inc()
+                    if last_attempt:
+                        raise
+                    response = None
+                except httpx.HTTPError:
+                    ESI_RESPONSES.labels(op, "error").inc()
+                    raise
+                finally:
+                    ESI_REQUEST_SECONDS.labels(op).observe(time.perf_counter() - start)
+
+            if response is not None:
+                ESI_RESPONSES.labels(op, str(response.status_code)).inc()
+                ESI_RESPONSE_BYTES.labels(op).inc(len(response.content))
+                self._note_error_budget(response)
+                status = response.status_code
+                if status == 304:
+                    return response, None
+                if status < 400:
+                    try:
+                        return response, response.json()
+                    except json.JSONDecodeError:
+                        if last_attempt:
+                            raise
+                elif status in ESI_THROTTLE_STATUSES:
+                    if last_attempt:
+                        response.raise_for_status()
+                    # The shared pause set above delays the retry; no extra backoff needed.
+                    continue
+                elif status not in ESI_RETRY_STATUSES or last_attempt:
+                    response.raise_for_status()
+
+            print(f"[ESI] {op} attempt {attempt + 1} failed; retrying", flush=True)
+            await asyncio.sleep(ESI_RETRY_BACKOFF * 2 ** attempt)
+        raise AssertionError("unreachable")
+
+    async def get_op(self, op: str, **params: Any) -> Any:
+        return (await self.request(op, **params)).data
+
+    async def get_paged(self, op: str, **params: Any) -> list:
+        """Fetch page 1, then fan out the remaining pages in parallel once X-Pages is known."""
+        first = await self.request(op, page=1, **params)
+        rows = list(first.data or [])
+        if first.pages > 1:
+            pages = await asyncio.gather(
+                *(self.request(op, page=page, **params) for page in range(2, first.pages + 1))
+            )
+            for response in pages:
+                rows.extend(response.data or [])
+        return rows
+
+    async def get_many(self, op: str, params_list: list[dict[str, Any]]) -> list[Any]:
+        """Run one operation for many parameter sets concurrently; failures are returned, not raised."""
+        return await asyncio.gather(
+            *(self.get_op(op, **params) for params in params_list),
+            return_exceptions=True,
+        )
+
+    def close(self) -> None:
+        if self._loop is None:
+            return
+        if self._http is not None:
+            self.run(self._http.aclose())
+            self._http = None
+        self.run(self.response_cache.close())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._loop = None
+
+
+esi_async = AsyncEsiClient(esi_manager.get_access_token)
@@ -0,0 +1,217 @@
+import threading
+import time
+import zlib
+from typing import NamedTuple
+
+from prometheus_client import REGISTRY, generate_latest
+from prometheus_client.core import GaugeMetricFamily
+from prometheus_client.registry import Collector
+
+from app import cache
+from app.cache import get_json
+from app.coordination import is_leader
+from app.config import settings
+from app.esi import esi_manager
+from app.market import (
+    CORP_PROFIT_INDEX_KEY,
+    CROSS_REGION_PROFIT_KEY,
+    PROFIT_INDEX_KEY,
+    corp_profit_index_key,
+    get_region_ids,
+    region_key,
+)
+from app.sales import SALES_INGESTED_KEY, CorpSoldAverage, get_corp_average_sold_volume, get_sales_corporation_id
+from app.wallet import WALLET_BALANCES_KEY, wallet_balances_key
+
+# Item families: (metric name, help text, snapshot field).
+ITEM_METRICS = (
+    ("esi_item_profit_index", "Profit index per item", "profit_index"),
+    ("esi_item_sell_price", "Sell price per item", "sell_price"),
+    ("esi_item_production_cost", "Production cost per item", "production_cost"),
+    ("esi_item_avg_volume", "Average daily volume per item", "avg_volume"),
+    ("esi_item_blueprint_cost", "Blueprint cost per item", "blueprint_cost"),
+    ("esi_item_return_time_seconds", "Return time per item (seconds)", "return_time_seconds"),
+)
+# Gauges follow Prometheus conventions: value is the metric, labels identify the series.
+# corporation is empty for the public market ranking.
+ITEM_LABELS = ["item_id", "item_name", "source", "region", "corporation"]
+
+
+class MetricsSnapshot(NamedTuple):
+    # (source, corporation_id or "", region_id, profit index entries) per audience and region
+    profit_indexes: tuple[tuple[str, str, int, tuple[dict, ...]], ...]
+    cross_region: tuple[dict, ...]
+    # (corporation_id, division name, balance)
+    wallet_balances: tuple[tuple[str, str, float], ...]
+    corp_sales: tuple[CorpSoldAverage, ...]
+    sales_corporation: str
+
+
+class SnapshotCollector(Collector):
+    """Builds metric families straight from one immutable snapshot.
+
+    A fresh collector is created per render, so concurrent renders never share state and
+    the cost is proportional to the number of series emitted.
+    """
+
+    def __init__(self, snapshot: MetricsSnapshot):
+        self.snapshot = snapshot
+
+    def collect(self):
+        item_families = [
+            (GaugeMetricFamily(name, documentation, labels=ITEM_LABELS), field)
+            for name, documentation, field in ITEM_METRICS
+        ]
+        for source, corporation, region_id, indexes in self.snapshot.profit_indexes:
+            seen: set[int] = set()
+            for index in indexes:
+                # Several blueprints can yield the same product; keep its best-ranked entry only.
+                if index["item_id"] in seen:
+                    continue
+                seen.add(index["item_id"])
+                labels = [str(index["item_id"]), index["item_name"], source, str(region_id), corporation]
+                for family, field in item_families:
+                    family.add_metric(labels, index[field])
+        for family, _ in item_families:
+            yield family
+
+        cross = GaugeMetricFamily(
+            "esi_item_cross_region_profit_index",
+            "Profit index per item, building from the cheapest material region and selling in the best region",
+            labels=["item_id", "item_name", "buy_region", "sell_region"],
+        )
+        seen = set()
+        for entry in self.snapshot.cross_region:
+            if entry["item_id"] in seen:
+                continue
+            seen.add(entry["item_id"])
+            cross.add_metric(
+                [str(entry["item_id"]), entry["item_name"], str(entry["buy_region_id"]), str(entry["sell_region_id"])],
+                entry["profit_index"],
+            )
+        yield cross
+
+        wallet = GaugeMetricFamily(
+            "esi_wallet_balance", "Wallet balance per division", labels=["division", "corporation"]
+        )
+        for corporation, name, balance in self.snapshot.wallet_balances:
+            wallet.add_metric([name, corporation], balance)
+        yield wallet
+
+        sold = GaugeMetricFamily(
+            "esi_corp_avg_sold_volume",
+            "Average sold volume per item for the corporation over the configured window (days)",
+            labels=["item_id", "item_name", "source", "corporation"],
+        )
+        for sale in self.snapshot.corp_sales:
+            sold.add_metric(
+                [str(sale.item_id), sale.item_name, "corp", self.snapshot.sales_corporation], sale.avg_volume
+            )
+        yield sold
+
+
+# Writes under these keys (by any replica) make the current rendering stale.
+SNAPSHOT_KEY_PREFIXES = (
+    PROFIT_INDEX_KEY,
+    CORP_PROFIT_INDEX_KEY,
+    CROSS_REGION_PROFIT_KEY,
+    WALLET_BALANCES_KEY,
+    SALES_INGESTED_KEY,
+)
+
+
+class RenderedMetrics:
+    def __init__(self, body: bytes, generation: int = 0):
+        self.body = body
+        self.generation = generation
+        self.rendered_at = time.time()
+        # Compress once and keep the deflate state at a sync point, so the live registry
+        # is appended to the same gzip member without recompressing the body.
+        self._compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        self._gzip_prefix = self._compressor.compress(body) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+        # (built at, plain, gzipped) exposition including the live registry.
+        self._exposition: tuple[float, bytes, bytes] | None = None
+        self._exposition_lock = threading.Lock()
+
+    def exposition(self, gzip: bool) -> bytes:
+        """Body plus the default registry, both encodings reused for ``metrics_live_max_age_seconds``."""
+        with self._exposition_lock:
+            cached = self._exposition
+            if cached is None or time.monotonic() - cached[0] > settings.metrics_live_max_age_seconds:
+                live = generate_latest(REGISTRY)
+                compressor = self._compressor.copy()
+                cached = self._exposition = (
+                    time.monotonic(),
+                    self.body + live,
+                    self._gzip_prefix + compressor.compress(live) + compressor.flush(),
+                )
+        return cached[2] if gzip else cached[1]
+
+    def age(self) -> float:
+        return time.time() - self.rendered_at
+
+
+_rendered: RenderedMetrics | None = None
+_snapshot_generation = 0
+
+
+def load_snapshot() -> MetricsSnapshot:
+    """Read the stored snapshots; never computes or calls ESI."""
+    region_ids = get_region_ids()
+    corporation_ids = list(esi_manager.corporations())
+    sources = [("market", "", PROFIT_INDEX_KEY)]
+    sources += [("corp", str(corp), corp_profit_index_key(corp)) for corp in corporation_ids]
+    profit_indexes = [
+        (source, corporation, region_id, tuple(get_json(region_key(cache_key, region_id)) or []))
+        for source, corporation, cache_key in sources
+        for region_id in region_ids
+    ]
+    cross_region = tuple(get_json(CROSS_REGION_PROFIT_KEY) or []) if len(region_ids) > 1 else ()
+    balances = [
+        (str(corp), name, balance)
+        for corp in corporation_ids
+        for name, balance in (get_json(wallet_balances_key(corp)) or {}).items()
+    ]
+    sales_corporation = get_sales_corporation_id()
+    return MetricsSnapshot(
+        profit_indexes=tuple(profit_indexes),
+        cross_region=cross_region,
+        wallet_balances=tuple(balances),
+        corp_sales=tuple(get_corp_average_sold_volume()) if sales_corporation else (),
+        sales_corporation=str(sales_corporation or ""),
+    )
+
+
+def render_metrics() -> RenderedMetrics:
+    global _rendered
+    # Taken before reading, so a write landing mid-render still marks this rendering stale.
+    generation = _snapshot_generation
+    # generate_latest only needs an object with collect(), so no shared registry is involved.
+    rendered = RenderedMetrics(generate_latest(SnapshotCollector(load_snapshot())), generation)
+    _rendered = rendered
+    return rendered
+
+
+def get_rendered_metrics() -> RenderedMetrics:
+    """Latest rendered exposition, re-rendered when missing, invalidated or older than the max age."""
+    rendered = _rendered
+    if (
+        rendered is None
+        or rendered.generation != _snapshot_generation
+        or rendered.age() > settings.metrics_max_age_seconds
+    ):
+        rendered = render_metrics()
+    return rendered
+
+
+def _on_snapshot_invalidated(key: str | None) -> None:
+    global _snapshot_generation
+    # The leader renders right after its own writes; followers re-render on their next scrape.
+    if is_leader():
+        return
+    if key is None or key.startswith(SNAPSHOT_KEY_PREFIXES):
+        _snapshot_generation += 1
+
+
+def watch_snapshots() -> None:
+    cache.add_invalidation_listener(_on_snapshot_invalidated)
@@ -0,0 +1,116 @@
+import time
+
+from prometheus_client import Counter, Gauge, Histogram
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Self-instrumentation lives in the default registry, which /metrics appends to the
+# pre-rendered business gauges and re-collects at most every metrics_live_max_age_seconds.
+
+ESI_REQUEST_SECONDS = Histogram(
+    "lumacorp_esi_request_duration_seconds",
+    "ESI HTTP request latency per operation (excluding concurrency-limit waits)",
+    ["operation"],
+    buckets=(0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+ESI_RESPONSES = Counter(
+    "lumacorp_esi_responses_total",
+    "ESI responses per operation and HTTP status",
+    ["operation", "status"],
+)
+ESI_RESPONSE_BYTES = Counter(
+    "lumacorp_esi_response_bytes_total",
+    "ESI response body bytes received per operation",
+    ["operation"],
+)
+ESI_RESPONSE_CACHE = Counter(
+    "lumacorp_esi_response_cache_total",
+    "ESI conditional cache outcomes (hit: served fresh, not_modified: 304, miss: full body)",
+    ["operation", "outcome"],
+)
+
+CACHE_LOOKUPS = Counter(
+    "lumacorp_cache_lookups_total",
+    "get_json lookups per key namespace (local_hit: in-process tier, hit: Redis, miss: absent)",
+    ["namespace", "result"],
+)
+CACHE_SECONDS = Histogram(
+    "lumacorp_cache_operation_duration_seconds",
+    "get_json/set_json latency including JSON (de)serialisation",
+    ["operation", "namespace"],
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5),
+)
+
+PRICE_CACHE_LOOKUPS = Counter(
+    "lumacorp_price_cache_lookups_total",
+    "PriceCache get_or_fill lookups (hit: in-process, shared_hit: Redis, coalesced: joined a fill, miss: filled)",
+    ["cache", "result"],
+)
+PRICE_CACHE_EVICTIONS = Counter(
+    "lumacorp_price_cache_evictions_total",
+    "PriceCache entries evicted to stay within max_entries",
+    ["cache"],
+)
+
+DB_QUERY_SECONDS = Histogram(
+    "lumacorp_db_query_duration_seconds",
+    "SQLite statement execution time per statement type",
+    ["statement"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+
+JOB_SECONDS = Histogram(
+    "lumacorp_job_duration_seconds",
+    "Scheduler job run time",
+    ["job"],
+    buckets=(1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600, 7200, 14400, 28800),
+)
+JOB_RUNS = Counter(
+    "lumacorp_job_runs_total",
+    "Scheduler job runs by outcome",
+    ["job", "outcome"],
+)
+JOB_LAST_SUCCESS = Gauge(
+    "lumacorp_job_last_success_timestamp_seconds",
+    "Unix time of the job's last successful run in this process",
+    ["job"],
+)
+PIPELINE_STAGE_SECONDS = Histogram(
+    "lumacorp_pipeline_stage_duration_seconds",
+    "Pipeline stage run time",
+    ["pipeline", "stage"],
+    buckets=(0.1, 0.5, 1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600, 7200),
+)
+
+_STATEMENT_TYPES = ("SELECT", "INSERT", "UPDATE", "DELETE", "PRAGMA", "CREATE", "ATTACH", "DETACH")
+
+
+def key_namespace(key: str) -> str:
+    """First segment of a cache key; keeps label cardinality to the handful of key families."""
+    return key.split(":", 1)[0]
+
+
+def _statement_type(statement: str) -> str:
+    keyword = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else ""
+    return keyword if keyword in _STATEMENT_TYPES else "OTHER"
+
+
+def instrument_engine(engine: Engine) -> None:
+    """Time every statement the engine executes."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["query_started"].pop()
+        DB_QUERY_SECONDS.labels(_statement_type(statement)).observe(time.perf_counter() - started)
+
+    @event.listens_for(engine, "handle_error")
+    def _failed(context):
+        # A failed statement never reaches after_cursor_execute; drop its start time.
+        if context.connection is not None:
+            started = context.connection.info.get("query_started")
+            if started:
+                started.pop()
@@ -1,4 +1,5 @@
 import asyncio
+import time
 from contextlib import asynccontextmanager
 from datetime import datetime, timedelta, timezone
 from typing import Awaitable, Callable
@@ -8,46 +9,200 @@ from fastapi import FastAPI
 
 from app.config import settings
 from app.db import engine, Base
-from app.esi import esi_manager
+from app.esi import esi_async, esi_manager
 import app.models.token  # ensure tables are registered
 import app.models.transaction  # ensure tables are registered
-from app.market import get_profit_indexes, get_corp_profit_indexes
+import app.models.market_history  # ensure tables are registered
+import app.models.snapshot  # ensure tables are registered
+from app.market import (
+    PROFIT_INDEX_KEY,
+    corp_profit_index_key,
+    fill_region_history,
+    get_region_ids,
+    price_region,
+    rank_cross_region,
+    rank_profit_indexes,
+)
+from app.orderbook import get_order_book
+from app.pipeline import Pipeline, Stage
+from app.production import get_bom_matrix
+from app.sde import (
+    get_character_skills,
+    get_corp_blueprint_type_ids,
+    get_market_order_type_ids,
+    load_sde_items,
+    select_buildable,
+)
 from app.wallet import refresh_wallet_balances
 from app.sales import ingest_corp_sales
+from app.snapshots import restore_snapshots
+from app.coordination import elector, get_job_last_run, is_leader, job_lock, record_job_run
+from app.exposition import render_metrics, watch_snapshots
+from app.instrumentation import JOB_LAST_SUCCESS, JOB_RUNS, JOB_SECONDS
+from app import profiling
 
-from app.routes import auth, metrics
+from app.routes import admin, auth, metrics
 
-async def refresh_profit_data() -> None:
-    """Refresh both public and corp blueprint profitability snapshots."""
-    esi_manager.get_client()
-    if not settings.character_id:
-        print("[SCHED] Profit refresh skipped; character not authenticated")
-        return
 
-    await get_profit_indexes(refresh=True)
-    await get_corp_profit_indexes(refresh=True)
+async def _fan_out(func: Callable, args: list) -> dict:
+    """Run ``func(arg)`` for every arg on worker threads; results keyed by arg."""
+    results = await asyncio.gather(*(asyncio.to_thread(func, arg) for arg in args))
+    return dict(zip(args, results))
+
+
+async def _stage_principals(inputs: dict) -> dict[str, int]:
+    principals = await asyncio.to_thread(esi_manager.load_clients)
+    if not principals:
+        # Fails every audience stage, so existing snapshots are not replaced with empty rankings.
+        raise RuntimeError("no character authenticated")
+    return principals
+
+
+async def _stage_sde(inputs: dict):
+    return await asyncio.to_thread(load_sde_items)
+
+
+async def _stage_skills(inputs: dict):
+    return await _fan_out(get_character_skills, list(inputs["principals"]))
+
+
+async def _stage_order_books(inputs: dict):
+    return await _fan_out(get_order_book, get_region_ids())
+
+
+async def _stage_corp_blueprints(inputs: dict):
+    corporation_ids = sorted(set(inputs["principals"].values()))
+    return await _fan_out(lambda corp: get_corp_blueprint_type_ids(corp, refresh=True), corporation_ids)
+
+
+def _select_audiences(items, principals, skills, market_ids, corp_blueprints) -> dict:
+    # audience -> (snapshot key, items); audiences differ only in the blueprint filter.
+    audiences = {"market": (PROFIT_INDEX_KEY, select_buildable(items, market_ids, list(skills.values())))}
+    for corp, owned_ids in corp_blueprints.items():
+        members = [character for character, member_corp in principals.items() if member_corp == corp]
+        audiences[f"corp:{corp}"] = (
+            corp_profit_index_key(corp),
+            select_buildable(items, owned_ids, [skills[character] for character in members]),
+        )
+    return audiences
+
+
+async def _stage_audiences(inputs: dict):
+    # Market type ids span every configured region's book, all swept by the order book stage.
+    market_ids = await asyncio.to_thread(get_market_order_type_ids)
+    return await asyncio.to_thread(
+        _select_audiences,
+        inputs["sde"], inputs["principals"], inputs["skills"], market_ids, inputs["corp_blueprints"],
+    )
+
+
+async def _stage_prices(inputs: dict):
+    bom, _ = get_bom_matrix(inputs["sde"])
+    return await _fan_out(lambda region_id: price_region(bom, region_id), list(inputs["order_books"]))
+
+
+async def _stage_history(inputs: dict):
+    # One history pass per region covers every audience's candidates, cross-region ones included.
+    union = {item.blueprint_id: item for _, items in inputs["audiences"].values() for item in items}
+    items = list(union.values())
+    region_ids = get_region_ids()
+    return await _fan_out(lambda region_id: fill_region_history(items, region_id, region_ids), region_ids)
+
+
+async def _stage_ranking(inputs: dict):
+    jobs = [
+        (audience, cache_key, items, region_id)
+        for audience, (cache_key, items) in inputs["audiences"].items()
+        for region_id in get_region_ids()
+    ]
+    rankings = await asyncio.gather(*(
+        asyncio.to_thread(rank_profit_indexes, items, cache_key, region_id)
+        for _, cache_key, items, region_id in jobs
+    ))
+    return {(audience, region_id): ranking for (audience, _, _, region_id), ranking in zip(jobs, rankings)}
+
+
+async def _stage_cross_region(inputs: dict):
+    region_ids = get_region_ids()
+    if len(region_ids) < 2:
+        return []
+    _, items = inputs["audiences"]["market"]
+    return await asyncio.to_thread(rank_cross_region, items, region_ids)
+
+
+async def _stage_render(inputs: dict):
+    await asyncio.to_thread(render_metrics)
+
+
+# SDE load -> skills -> order books -> history -> per-audience ranking, shared by every audience.
+PROFIT_PIPELINE = Pipeline("profit-refresh", [
+    Stage("principals", _stage_principals),
+    Stage("sde", _stage_sde),
+    Stage("skills", _stage_skills, ("principals",)),
+    Stage("corp_blueprints", _stage_corp_blueprints, ("principals",)),
+    Stage("order_books", _stage_order_books),
+    Stage("audiences", _stage_audiences, ("sde", "principals", "skills", "corp_blueprints", "order_books")),
+    Stage("prices", _stage_prices, ("sde", "order_books")),
+    Stage("history", _stage_history, ("audiences", "prices")),
+    Stage("ranking", _stage_ranking, ("audiences", "history")),
+    Stage("cross_region", _stage_cross_region, ("audiences", "history")),
+    Stage("render", _stage_render, ("ranking", "cross_region")),
+])
+
+
+async def refresh_profit_data() -> None:
+    """Refresh public and per-corp blueprint profitability snapshots for every pooled character."""
+    await PROFIT_PIPELINE.run()
 
 
 async def refresh_wallet_data() -> None:
-    """Refresh wallet balances snapshot."""
-    esi_manager.get_client()
-    if not settings.corp_id:
-        print("[SCHED] Wallet refresh skipped; corp not set")
+    """Refresh wallet balance snapshots for every pooled corporation."""
+    if not await asyncio.to_thread(esi_manager.load_clients):
+        print("[SCHED] Wallet refresh skipped; no character authenticated")
         return
     await refresh_wallet_balances()
+    await asyncio.to_thread(render_metrics)
+
+
+def refresh_corp_sales() -> None:
+    """Ingest new corp transactions and re-render the sold-volume series."""
+    ingest_corp_sales()
+    render_metrics()
 
 
 def _job_wrapper(coro: Callable, name: str, run_in_thread: bool = False) -> Callable[[], Awaitable[None]]:
     async def runner():
+        # Every replica schedules every job; only the leader runs them, one at a time across replicas.
+        if not is_leader():
+            return
         try:
-            if asyncio.iscoroutinefunction(coro):
-                await coro()
-            elif run_in_thread:
-                await asyncio.to_thread(coro)
-            else:
-                coro()
+            async with job_lock(name) as acquired:
+                if not acquired:
+                    print(f"[SCHED] Job '{name}' skipped; still running elsewhere")
+                    return
+                # None unless an admin armed a profile for this job's next run.
+                session = profiling.claim(profiling.job_target(name))
+                start = time.perf_counter()
+                try:
+                    if asyncio.iscoroutinefunction(coro):
+                        await profiling.run_async(session, coro)
+                    elif run_in_thread:
+                        await asyncio.to_thread(profiling.run_sync, session, coro)
+                    else:
+                        profiling.run_sync(session, coro)
+                except (Exception, asyncio.CancelledError):
+                    # Includes a run cancelled because its job lock lapsed.
+                    JOB_RUNS.labels(name, "failure").inc()
+                    raise
+                finally:
+                    JOB_SECONDS.labels(name).observe(time.perf_counter() - start)
+                JOB_RUNS.labels(name, "success").inc()
+                JOB_LAST_SUCCESS.labels(name).set_to_current_time()
+                await asyncio.to_thread(record_job_run, name)
         except Exception as exc:
             print(f"[SCHED] Job '{name}' error: {exc}")
+    # Coroutine jobs run on the event loop, where only sampling sees their executor threads.
+    runner.is_coroutine = asyncio.iscoroutinefunction(coro)
     return runner
 
 
@@ -73,7 +228,7 @@ def _start_scheduler() -> AsyncIOScheduler:
         next_run_time=datetime.now(tz=timezone.utc) + timedelta(seconds=5),
     )
     scheduler.add_job(
-        _job_wrapper(ingest_corp_sales, "corp-sales-ingest", run_in_thread=True),
+        _job_wrapper(refresh_corp_sales, "corp-sales-ingest", run_in_thread=True),
         trigger="interval",
         seconds=max(1, settings.corp_sales_refresh_seconds),
         id="corp-sales-ingest",
@@ -85,13 +240,33 @@ def _start_scheduler() -> AsyncIOScheduler:
     return scheduler
 
 
+def _catch_up_on_election(scheduler: AsyncIOScheduler) -> Callable[[], Awaitable[None]]:
+    async def on_elected():
+        # A new leader runs right away whatever the previous leader left overdue.
+        now = datetime.now(tz=timezone.utc)
+        for job in scheduler.get_jobs():
+            last_run = await asyncio.to_thread(get_job_last_run, job.id)
+            if last_run is None or time.time() - last_run >= job.trigger.interval.total_seconds():
+                job.modify(next_run_time=now)
+    return on_elected
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    # Serve the last checkpointed snapshots within seconds if Redis came back empty.
+    await asyncio.to_thread(restore_snapshots)
     scheduler = _start_scheduler()
+    app.state.scheduler = scheduler
+    await elector.start(on_elected=_catch_up_on_election(scheduler))
+    # Followers re-render /metrics when the leader publishes new snapshots.
+    watch_snapshots()
     try:
         yield
     finally:
+        await elector.stop()
         scheduler.shutdown(wait=False)
+        esi_async.close()
+        esi_manager.close()
         print("[SCHED] Scheduler stopped")
 
 
@@ -100,4 +275,5 @@ app = FastAPI(lifespan=lifespan)
 Base.metadata.create_all(bind=engine)
 
 app.include_router(auth.router)
+app.include_router(admin.router)
 app.include_router(metrics.router)
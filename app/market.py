@@ -1,20 +1,36 @@
-from app.cache import get_json, set_json
-from app.esi import esi_manager
+from app.cache import get_json
+from app.esi import esi_async
 from app.config import settings
-from app.sde import Item, get_items, get_corp_blueprint_items
+from app.crud.market_history import (
+    get_history_synced_at,
+    get_latest_history_dates,
+    get_volume_sums_between,
+    insert_history,
+    mark_history_synced,
+)
+from app.db import SessionLocal
+from app.orderbook import OrderBook, get_order_book, get_region_ids
+from app.production import BomMatrix, get_bom_matrix
+from app.sde import Item
+from app.snapshots import store_snapshot
 import json
+import numpy as np
 from typing import List, Dict
 from pydantic import BaseModel
-from concurrent.futures import ThreadPoolExecutor
-import asyncio
-from datetime import datetime, timedelta, timezone
+from threading import Lock
+from datetime import date, datetime, time, timedelta, timezone
 
-material_prices = {}
+# ESI publishes the previous day's market history once a day, shortly after the 11:00 UTC downtime.
+HISTORY_PUBLISHED_AT = time(11, 5)
 
 PROFIT_INDEX_KEY = "market:profit_indexes"
 CORP_PROFIT_INDEX_KEY = "market:corp_profit_indexes"
+CROSS_REGION_PROFIT_KEY = "market:cross_region_profit_indexes"
+
+
+def region_key(cache_key: str, region_id: int) -> str:
+    return f"{cache_key}:{region_id}"
 
-executor = ThreadPoolExecutor(max_workers=4)
 
 class ProfitIndex(BaseModel):
     item_name: str
@@ -27,134 +43,293 @@ class ProfitIndex(BaseModel):
     return_time_seconds: float
 
 
-def _get_lowest_order_price(type_id: int, order_type: str) -> float:
-    esi = esi_manager.get_client()
-    orders = esi.get_op("get_markets_region_id_orders", region_id=settings.region_id, type_id=type_id, order_type=order_type)
-    if not orders:
-        return 0
-
-    lowest_price = 0
-    for order in orders:
-        if not lowest_price or order["price"] < lowest_price:
-            lowest_price = order["price"]
-    return lowest_price
-
-def _get_item_margin(item: Item) -> float:
-    sell_price = _get_lowest_order_price(item.type_id, "sell")
-    if not sell_price:
-        return 0
-
-    production_cost = 0
-    for material in item.materials:
-        material_price = material_prices.get(material.type_id)
-        if not material_price:
-            material_price = _get_lowest_order_price(material.type_id, "sell")
-            material_prices[material.type_id] = material_price
-        production_cost += material_price * material.quantity
-
-    return sell_price - production_cost
-
-def _get_item_daily_avg_volume(item: Item) -> float:
-    esi = esi_manager.get_client()
-    
-    # Get history data
-    history = esi.get_op("get_markets_region_id_history", region_id=settings.region_id, type_id=item.type_id)
-    
-    end_date = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
-    start_date = end_date - timedelta(days=settings.avg_daily_volume_window)
-    
-    total_volume = 0
-    
+class CrossRegionProfit(BaseModel):
+    item_name: str
+    item_id: int
+    buy_region_id: int
+    sell_region_id: int
+    production_cost: float
+    sell_price: float
+    avg_volume: float
+    profit_index: float
+
+
+def _history_rows(region_id: int, type_id: int, history: list[dict], after: date | None) -> list[dict]:
+    rows = []
     for entry in history:
-        entry_date = datetime.strptime(entry['date'], '%Y-%m-%d').replace(tzinfo=timezone.utc)
-        if start_date <= entry_date < end_date:
-            total_volume += entry['volume']
-            
-    return total_volume / settings.avg_daily_volume_window
-
-def _get_item_profit_index(item: Item) -> tuple[float, float, float, float]:
-    sell_price = _get_lowest_order_price(item.type_id, "sell")
-    if not sell_price:
-        return 0, 0, 0, 0
-        
-    production_cost = 0
-    for material in item.materials:
-        material_price = material_prices.get(material.type_id)
-        if not material_price:
-            material_price = _get_lowest_order_price(material.type_id, "sell")
-            material_prices[material.type_id] = material_price
-        production_cost += material_price * material.quantity
-        
-    margin = sell_price - production_cost
-    if not margin:
-        return 0, 0, 0, 0
-        
-    daily_avg_volume = _get_item_daily_avg_volume(item)
-    if not daily_avg_volume:
-        return 0, 0, 0, 0
-    
-    return margin * daily_avg_volume, sell_price, production_cost, daily_avg_volume
-
-def _calculate_profit_indexes(items: list[Item], cache_key: str) -> list[ProfitIndex]:
-    profit_indexes: list[ProfitIndex] = []
-    for item in items:
-        profit_index, sell_price, production_cost, daily_avg_volume = _get_item_profit_index(item)
-        if not profit_index or profit_index < 0 or profit_index < settings.min_profit_threshold:
+        entry_date = date.fromisoformat(entry["date"])
+        if after is not None and entry_date <= after:
+            continue
+        rows.append(dict(
+            region_id=region_id,
+            type_id=type_id,
+            date=entry_date,
+            volume=entry["volume"],
+            average=entry["average"],
+            highest=entry["highest"],
+            lowest=entry["lowest"],
+            order_count=entry["order_count"],
+        ))
+    return rows
+
+def _last_history_publish(now: datetime) -> datetime:
+    published = datetime.combine(now.date(), HISTORY_PUBLISHED_AT)
+    return published if now >= published else published - timedelta(days=1)
+
+def _sync_market_history(db, region_id: int, type_ids: list[int], today: date) -> None:
+    """Append the days each type is missing; each type is fetched at most once per ESI publish."""
+    latest = get_latest_history_dates(db, region_id, type_ids)
+    synced_at = get_history_synced_at(db, region_id, type_ids)
+    yesterday = today - timedelta(days=1)
+    # Naive UTC, as SQLite hands DateTime columns back.
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    published = _last_history_publish(now)
+    # A type missing yesterday may simply not have traded, so its last fetch decides, not its last day.
+    stale = [
+        type_id for type_id in type_ids
+        if (latest.get(type_id) is None or latest[type_id] < yesterday)
+        and (synced_at.get(type_id) is None or synced_at[type_id] < published)
+    ]
+    if not stale:
+        return
+
+    # ESI only serves the full series, so fetch stale types concurrently and keep the new tail.
+    histories = esi_async.run(esi_async.get_many(
+        "get_markets_region_id_history",
+        [dict(region_id=region_id, type_id=type_id) for type_id in stale],
+    ))
+
+    rows: list[dict] = []
+    fetched: list[int] = []
+    for type_id, history in zip(stale, histories):
+        if isinstance(history, Exception):
+            print(f"[MARKET] History unavailable for {type_id}: {history}")
             continue
-        blueprint_cost = _get_lowest_order_price(item.blueprint_id, "sell")
-        return_time_seconds = (blueprint_cost / profit_index) * 24 * 60 * 60
+        fetched.append(type_id)
+        rows.extend(_history_rows(region_id, type_id, history, latest.get(type_id)))
+    inserted = insert_history(db, rows)
+    mark_history_synced(db, region_id, fetched, now)
+    print(f"[MARKET] Region {region_id} history synced for {len(stale)} types ({inserted} new days)")
+
+def _get_items_daily_avg_volume(items: list[Item], region_id: int) -> dict[int, float]:
+    today = datetime.now(timezone.utc).date()
+    start = today - timedelta(days=settings.avg_daily_volume_window)
+    type_ids = [item.type_id for item in items]
+    if not type_ids:
+        return {}
+
+    with SessionLocal() as db:
+        _sync_market_history(db, region_id, type_ids, today)
+        sums = get_volume_sums_between(db, region_id, start, today, type_ids)
+
+    return {type_id: sums.get(type_id, 0) / settings.avg_daily_volume_window for type_id in type_ids}
+
+
+class _CatalogState:
+    """Last priced state of the whole blueprint catalog in one region, patched in place on each refresh.
+
+    Prices are only taken over when they move beyond ``profit_price_tolerance``, so small
+    jitter never triggers work and slow drift still does once it accumulates.
+    """
+
+    def __init__(self, bom: BomMatrix, region_id: int):
+        self.bom = bom
+        self.region_id = region_id
+        self.material_prices = np.zeros(len(bom.material_ids), dtype=np.float64)
+        self.sell_prices = np.zeros(len(bom), dtype=np.float64)
+        self.production_costs = np.zeros(len(bom), dtype=np.float64)
+        # Volumes come from daily history, so they are invalidated when the UTC day rolls over.
+        self.volumes = np.full(len(bom), np.nan)
+        self.volume_day = None
+        self.lock = Lock()
+
+    def update_prices(self, book: OrderBook) -> np.ndarray:
+        """Take over moved prices and recompute costs for affected rows; returns the changed rows."""
+        material_prices = book.min_sell_vector(self.bom.material_ids)
+        sell_prices = book.min_sell_vector(self.bom.product_ids)
+        moved_materials = np.flatnonzero(_price_moved(self.material_prices, material_prices))
+        moved_sells = np.flatnonzero(_price_moved(self.sell_prices, sell_prices))
+
+        self.material_prices[moved_materials] = material_prices[moved_materials]
+        self.sell_prices[moved_sells] = sell_prices[moved_sells]
+
+        changed = np.union1d(self.bom.rows_using(moved_materials), moved_sells)
+        self.production_costs[changed] = self.bom.production_costs_for(changed, self.material_prices)
+        return changed
+
+    def margins(self, rows: np.ndarray) -> np.ndarray:
+        sell_prices = self.sell_prices[rows]
+        return np.where(sell_prices > 0, sell_prices - self.production_costs[rows], 0.0)
+
+    def fill_volumes(self, rows: np.ndarray, items: list[Item]) -> np.ndarray:
+        """Fetch history for any of ``rows`` without a volume for today; returns the rows filled."""
+        today = datetime.now(timezone.utc).date()
+        if self.volume_day != today:
+            self.volumes[:] = np.nan
+            self.volume_day = today
+
+        missing = np.flatnonzero(np.isnan(self.volumes[rows]))
+        if len(missing):
+            volumes_by_type = _get_items_daily_avg_volume([items[i] for i in missing], self.region_id)
+            self.volumes[rows[missing]] = [volumes_by_type[items[i].type_id] for i in missing]
+        return rows[missing]
 
+
+def _price_moved(previous: np.ndarray, current: np.ndarray) -> np.ndarray:
+    return np.abs(current - previous) > settings.profit_price_tolerance * np.abs(previous)
+
+
+_catalog_states: dict[int, _CatalogState] = {}
+_catalog_state_lock = Lock()
+
+
+def _get_catalog_state(bom: BomMatrix, region_id: int) -> _CatalogState:
+    with _catalog_state_lock:
+        state = _catalog_states.get(region_id)
+        if state is None or state.bom is not bom:
+            state = _catalog_states[region_id] = _CatalogState(bom, region_id)
+        return state
+
+
+def _patch_snapshot(cache_key: str, profit_indexes: list[BaseModel]) -> list[BaseModel]:
+    entries = [pi.model_dump() for pi in profit_indexes]
+    # Refreshes where nothing moved leave the stored snapshot (and its readers) untouched.
+    if entries != get_json(cache_key):
+        store_snapshot(cache_key, entries)
+    return profit_indexes
+
+
+def price_region(bom: BomMatrix, region_id: int) -> np.ndarray:
+    """Apply the region's current book to its catalog state; returns the rows whose cost or price moved."""
+    # Every price below comes from one region sweep instead of one ESI call per type.
+    book = get_order_book(region_id)
+    state = _get_catalog_state(bom, region_id)
+    with state.lock:
+        # Only products whose inputs or own sell price moved get a new production cost.
+        changed = state.update_prices(book)
+    print(f"[MARKET] Region {region_id}: recomputed {len(changed)} of {len(bom)} blueprints")
+    return changed
+
+
+def fill_region_history(items: list[Item], region_id: int, region_ids: list[int] | None = None) -> int:
+    """Fetch today's volumes for every priced item that can rank here; returns how many were fetched.
+
+    That is every item with a positive margin in the region and, given all ``region_ids``, every
+    item whose cross-region build (cheapest materials anywhere) sells best in this region.
+    """
+    bom, rows = get_bom_matrix(items)
+    sold_here = np.zeros(len(rows), dtype=bool)
+    if region_ids and len(region_ids) > 1:
+        # Read before taking this region's lock; the matrices lock every region in turn.
+        costs, sells = _cross_region_prices(bom, rows, region_ids)
+        _, sell_regions, margins = _cross_region_best(costs, sells)
+        sold_here = (margins > 0) & (sell_regions == region_ids.index(region_id))
+
+    state = _get_catalog_state(bom, region_id)
+    with state.lock:
+        # Only items with a positive margin can rank, so only those need market history.
+        candidates = np.flatnonzero((state.margins(rows) > 0) | sold_here)
+        refreshed = state.fill_volumes(rows[candidates], [items[i] for i in candidates])
+    print(f"[MARKET] Region {region_id}: fetched history for {len(refreshed)} items")
+    return len(refreshed)
+
+
+def rank_profit_indexes(items: list[Item], cache_key: str, region_id: int) -> list[ProfitIndex]:
+    """Rank ``items`` from the region's priced state and store the snapshot; makes no history calls."""
+    book = get_order_book(region_id)
+    bom, rows = get_bom_matrix(items)
+    state = _get_catalog_state(bom, region_id)
+    with state.lock:
+        margins = state.margins(rows)
+        volumes = np.nan_to_num(state.volumes[rows])
+        production_costs = state.production_costs[rows]
+        sell_prices = state.sell_prices[rows]
+
+    profits = margins * volumes
+    eligible = np.flatnonzero((profits > 0) & (profits >= settings.min_profit_threshold))
+    ranked = eligible[np.argsort(-profits[eligible], kind="stable")][:settings.max_profit_indexes-1]
+    blueprint_costs = book.min_sell_vector(bom.blueprint_ids[rows[ranked]])
+
+    profit_indexes: list[ProfitIndex] = []
+    for i, blueprint_cost in zip(ranked.tolist(), blueprint_costs.tolist()):
+        profit_index = float(profits[i])
         profit_indexes.append(ProfitIndex(
-            item_name=item.name, 
-            item_id=item.type_id, 
+            item_name=items[i].name, 
+            item_id=items[i].type_id, 
             profit_index=profit_index,
-            sell_price=sell_price,
-            production_cost=production_cost,
-            avg_volume=daily_avg_volume,
+            sell_price=float(sell_prices[i]),
+            production_cost=float(production_costs[i]),
+            avg_volume=float(volumes[i]),
             blueprint_cost=blueprint_cost,
-            return_time_seconds=return_time_seconds
+            return_time_seconds=(blueprint_cost / profit_index) * 24 * 60 * 60
         ))
 
-    profit_indexes = sorted(profit_indexes, key=lambda x: x.profit_index, reverse=True)[:settings.max_profit_indexes-1]
+    return _patch_snapshot(region_key(cache_key, region_id), profit_indexes)
 
-    set_json(cache_key, [pi.model_dump() for pi in profit_indexes])
 
-    return profit_indexes
+def _cross_region_prices(bom: BomMatrix, rows: np.ndarray, region_ids: list[int]) -> tuple[np.ndarray, np.ndarray]:
+    """Regions x rows production costs (inf where an input is unpriced) and sell prices."""
+    costs, sells = [], []
+    for region_id in region_ids:
+        state = _get_catalog_state(bom, region_id)
+        with state.lock:
+            # Weighted count of unpriced inputs; a region missing any of them cannot supply the build.
+            unpriced = bom.production_costs((state.material_prices == 0).astype(np.float64))[rows]
+            costs.append(np.where(unpriced > 0, np.inf, state.production_costs[rows]))
+            sells.append(state.sell_prices[rows])
+    return np.array(costs), np.array(sells)
 
-async def get_profit_indexes(refresh: bool = False, compute_on_miss: bool = True) -> list[ProfitIndex]:
-    if not refresh:
-        cached = get_json(PROFIT_INDEX_KEY)
-        if cached:
-            return [ProfitIndex.model_validate(pi) for pi in cached]
-        if not compute_on_miss:
-            return []
-
-    items = await get_items()
-    loop = asyncio.get_event_loop()
-    print("[MARKET] Calculating profit indexes")
-    profit_indexes = await loop.run_in_executor(executor, _calculate_profit_indexes, items, PROFIT_INDEX_KEY)
-    print("[MARKET] Profit indexes calculated")
-    return profit_indexes
 
-async def get_corp_profit_indexes(refresh: bool = False, compute_on_miss: bool = True) -> list[ProfitIndex]:
-    if not settings.corp_id:
-        return []
-
-    if not refresh:
-        cached = get_json(CORP_PROFIT_INDEX_KEY)
-        if cached:
-            return [ProfitIndex.model_validate(pi) for pi in cached]
-        if not compute_on_miss:
-            return []
-
-    items = await get_corp_blueprint_items()
-    if not items:
-        return []
-
-    loop = asyncio.get_event_loop()
-    print("[MARKET] Calculating corp blueprint profit indexes")
-    profit_indexes = await loop.run_in_executor(executor, _calculate_profit_indexes, items, CORP_PROFIT_INDEX_KEY)
-    print("[MARKET] Corp blueprint profit indexes calculated")
-    return profit_indexes
+def _cross_region_best(costs: np.ndarray, sells: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Cheapest build region, best sell region and the margin between them, per row."""
+    columns = np.arange(costs.shape[1])
+    buy_regions = np.argmin(costs, axis=0)
+    sell_regions = np.argmax(sells, axis=0)
+    production_costs = costs[buy_regions, columns]
+    sell_prices = sells[sell_regions, columns]
+    margins = np.where(np.isfinite(production_costs) & (sell_prices > 0), sell_prices - production_costs, 0.0)
+    return buy_regions, sell_regions, margins
+
+
+def rank_cross_region(items: list[Item], region_ids: list[int]) -> list[CrossRegionProfit]:
+    """Rank items by building from the cheapest region's materials and selling where it pays most.
+
+    Reads the per-region catalog states left by the regional scans, so no ESI call is made.
+    """
+    bom, rows = get_bom_matrix(items)
+    costs, sells = _cross_region_prices(bom, rows, region_ids)
+    volumes = []
+    for region_id in region_ids:
+        state = _get_catalog_state(bom, region_id)
+        with state.lock:
+            volumes.append(np.nan_to_num(state.volumes[rows]))
+    volumes = np.array(volumes)
+
+    columns = np.arange(len(rows))
+    buy_regions, sell_regions, margins = _cross_region_best(costs, sells)
+    production_costs = costs[buy_regions, columns]
+    sell_prices = sells[sell_regions, columns]
+    avg_volumes = volumes[sell_regions, columns]
+
+    profits = margins * avg_volumes
+    eligible = np.flatnonzero((profits > 0) & (profits >= settings.min_profit_threshold))
+    ranked = eligible[np.argsort(-profits[eligible], kind="stable")][:settings.max_profit_indexes-1]
+
+    entries = [
+        CrossRegionProfit(
+            item_name=items[i].name,
+            item_id=items[i].type_id,
+            buy_region_id=region_ids[buy_regions[i]],
+            sell_region_id=region_ids[sell_regions[i]],
+            production_cost=float(production_costs[i]),
+            sell_price=float(sell_prices[i]),
+            avg_volume=float(avg_volumes[i]),
+            profit_index=float(profits[i]),
+        )
+        for i in ranked.tolist()
+    ]
+    return _patch_snapshot(CROSS_REGION_PROFIT_KEY, entries)
+
 
-    
+def corp_profit_index_key(corporation_id: int) -> str:
+    return f"{CORP_PROFIT_INDEX_KEY}:{corporation_id}"
@@ -0,0 +1,26 @@
+from sqlalchemy import BigInteger, Column, Date, DateTime, Float, Integer
+
+from app.db import Base
+
+
+class MarketHistory(Base):
+    __tablename__ = "market_history"
+
+    # Primary key order doubles as the (region, type, date) range index used by volume sums.
+    region_id = Column(Integer, primary_key=True)
+    type_id = Column(Integer, primary_key=True)
+    date = Column(Date, primary_key=True)
+    volume = Column(BigInteger, nullable=False)
+    average = Column(Float, nullable=False)
+    highest = Column(Float, nullable=False)
+    lowest = Column(Float, nullable=False)
+    order_count = Column(BigInteger, nullable=False)
+
+
+class MarketHistorySync(Base):
+    __tablename__ = "market_history_sync"
+
+    # When each type's series was last fetched; types that did not trade lately store no new days.
+    region_id = Column(Integer, primary_key=True)
+    type_id = Column(Integer, primary_key=True)
+    synced_at = Column(DateTime, nullable=False)
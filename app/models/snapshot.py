@@ -0,0 +1,17 @@
+from sqlalchemy import Column, DateTime, Integer, String, Text
+
+from app.db import Base
+
+
+class SnapshotCheckpoint(Base):
+    """Durable copy of a computed Redis snapshot, put back when Redis restarts empty."""
+
+    __tablename__ = "snapshot_checkpoints"
+
+    key = Column(String, primary_key=True)
+    # Bumped on every write of the key.
+    version = Column(Integer, nullable=False)
+    updated_at = Column(DateTime, nullable=False)
+    # Redis expiry the snapshot was written with; NULL for snapshots that never expire.
+    ttl_seconds = Column(Integer, nullable=True)
+    payload = Column(Text, nullable=False)
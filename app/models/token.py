@@ -2,7 +2,8 @@ from app.db import Base
 from sqlalchemy import Column, String, Integer
 
 class RefreshToken(Base):
+    """One row per authenticated character."""
     __tablename__ = "refresh_tokens"
-    id = Column(Integer, primary_key=True, default=1)
+    id = Column(Integer, primary_key=True)
     refresh_token = Column(String)
-    character_id = Column(String)
+    character_id = Column(String, index=True)
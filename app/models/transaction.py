@@ -1,4 +1,4 @@
-from sqlalchemy import Boolean, Column, DateTime, Float, Integer, BigInteger, func, UniqueConstraint, Index
+from sqlalchemy import Boolean, Column, Date, DateTime, Float, Integer, BigInteger, func, UniqueConstraint, Index
 
 from app.db import Base
 
@@ -20,3 +20,24 @@ class CorpTransaction(Base):
         UniqueConstraint("transaction_id", name="uq_corp_transactions_transaction_id"),
         Index("idx_corp_transactions_type_date", "type_id", "date"),
     )
+
+
+class CorpIngestCursor(Base):
+    """Newest transaction id per division whose full backlog has been ingested."""
+
+    __tablename__ = "corp_ingest_cursors"
+
+    division = Column(Integer, primary_key=True)
+    last_seen_id = Column(BigInteger, nullable=False)
+
+
+class CorpSalesDaily(Base):
+    """Quantity traded per type, UTC day and side; maintained alongside corp_transactions."""
+
+    __tablename__ = "corp_sales_daily"
+
+    # Key order serves "side = ? AND day >= ? GROUP BY type_id" as a single range scan.
+    is_buy = Column(Boolean, primary_key=True)
+    day = Column(Date, primary_key=True)
+    type_id = Column(Integer, primary_key=True)
+    quantity = Column(BigInteger, nullable=False)
@@ -0,0 +1,139 @@
+import time
+
+import numpy as np
+
+from app.config import settings
+from app.esi import esi_async
+from app.price_cache import PriceCache
+
+# ESI caches region order pages for five minutes, so a younger book is as fresh as it gets.
+ORDER_BOOK_MAX_AGE = 5 * 60
+ORDER_BOOK_CACHE_PREFIX = "market:order_book"
+
+
+class TypePrices:
+    __slots__ = ("min_sell", "max_buy", "sell_orders", "buy_orders")
+
+    def __init__(self):
+        self.min_sell = 0.0
+        self.max_buy = 0.0
+        self.sell_orders = 0
+        self.buy_orders = 0
+
+    def to_list(self) -> list:
+        return [self.min_sell, self.max_buy, self.sell_orders, self.buy_orders]
+
+    @classmethod
+    def from_list(cls, values: list) -> "TypePrices":
+        entry = cls()
+        entry.min_sell, entry.max_buy, entry.sell_orders, entry.buy_orders = values
+        return entry
+
+    def add_order(self, price: float, is_buy: bool) -> None:
+        if is_buy:
+            self.buy_orders += 1
+            if price > self.max_buy:
+                self.max_buy = price
+        else:
+            self.sell_orders += 1
+            if not self.min_sell or price < self.min_sell:
+                self.min_sell = price
+
+
+class OrderBook:
+    """Per-type price index built from one sweep of a region's order book."""
+
+    def __init__(self, region_id: int, prices: dict[int, TypePrices], fetched_at: float):
+        self.region_id = region_id
+        self.prices = prices
+        self.fetched_at = fetched_at
+
+        self._type_ids = np.array(sorted(prices), dtype=np.int64)
+        self._min_sell = np.array([prices[t].min_sell for t in self._type_ids.tolist()], dtype=np.float64)
+        self._max_buy = np.array([prices[t].max_buy for t in self._type_ids.tolist()], dtype=np.float64)
+
+    def get(self, type_id: int) -> TypePrices | None:
+        return self.prices.get(type_id)
+
+    def min_sell(self, type_id: int) -> float:
+        entry = self.prices.get(type_id)
+        return entry.min_sell if entry else 0
+
+    def max_buy(self, type_id: int) -> float:
+        entry = self.prices.get(type_id)
+        return entry.max_buy if entry else 0
+
+    def _lookup(self, column: np.ndarray, type_ids: np.ndarray) -> np.ndarray:
+        if not len(self._type_ids):
+            return np.zeros(len(type_ids), dtype=np.float64)
+        pos = np.clip(np.searchsorted(self._type_ids, type_ids), 0, len(self._type_ids) - 1)
+        return np.where(self._type_ids[pos] == type_ids, column[pos], 0.0)
+
+    def min_sell_vector(self, type_ids: np.ndarray) -> np.ndarray:
+        """Lowest sell price per type, aligned with ``type_ids`` (0 where there are no sell orders)."""
+        return self._lookup(self._min_sell, type_ids)
+
+    def max_buy_vector(self, type_ids: np.ndarray) -> np.ndarray:
+        return self._lookup(self._max_buy, type_ids)
+
+    def sell_type_ids(self) -> set[int]:
+        return {type_id for type_id, entry in self.prices.items() if entry.sell_orders}
+
+    def age(self) -> float:
+        return time.time() - self.fetched_at
+
+    def to_json(self) -> dict:
+        return {
+            "region_id": self.region_id,
+            "fetched_at": self.fetched_at,
+            "prices": {str(type_id): entry.to_list() for type_id, entry in self.prices.items()},
+        }
+
+    @classmethod
+    def from_json(cls, data: dict) -> "OrderBook":
+        prices = {int(type_id): TypePrices.from_list(values) for type_id, values in data["prices"].items()}
+        return cls(data["region_id"], prices, data["fetched_at"])
+
+
+def _sweep_region_orders(region_id: int) -> dict[int, TypePrices]:
+    # Page 1 reports X-Pages; the rest of the book is fetched in parallel.
+    orders = esi_async.run(
+        esi_async.get_paged("get_markets_region_id_orders", region_id=region_id, order_type="all")
+    )
+
+    prices: dict[int, TypePrices] = {}
+    for order in orders:
+        entry = prices.get(order["type_id"])
+        if entry is None:
+            entry = prices[order["type_id"]] = TypePrices()
+        entry.add_order(order["price"], order["is_buy_order"])
+
+    print(f"[MARKET] Region {region_id} order book: {len(prices)} types from {len(orders)} orders")
+    return prices
+
+
+# Books are shared through Redis so every process (and region) reuses one sweep per ESI cache window.
+order_books: PriceCache[OrderBook] = PriceCache(
+    "order_book",
+    ttl=ORDER_BOOK_MAX_AGE,
+    max_entries=settings.order_book_cache_size,
+    shared_prefix=ORDER_BOOK_CACHE_PREFIX if settings.order_book_shared else None,
+    encode=OrderBook.to_json,
+    decode=OrderBook.from_json,
+)
+
+
+def get_region_ids() -> list[int]:
+    return settings.region_ids or [settings.region_id]
+
+
+def get_order_book(region_id: int, refresh: bool = False) -> OrderBook:
+    """Return the region's order book, sweeping ESI when missing, expired or on refresh."""
+    if refresh:
+        order_books.invalidate(region_id)
+    # Concurrent callers for the same region wait on one sweep instead of starting their own.
+    return order_books.get_or_fill(
+        region_id,
+        lambda: OrderBook(region_id, _sweep_region_orders(region_id), time.time()),
+        ttl_of=lambda book: ORDER_BOOK_MAX_AGE - book.age(),
+    )
@@ -0,0 +1,133 @@
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, NamedTuple
+
+from app.instrumentation import PIPELINE_STAGE_SECONDS
+
+# A stage receives the results of its dependencies, keyed by stage name.
+StageFunc = Callable[[dict[str, Any]], Awaitable[Any]]
+
+
+class Stage(NamedTuple):
+    name: str
+    run: StageFunc
+    depends_on: tuple[str, ...] = ()
+
+
+class StageResult(NamedTuple):
+    name: str
+    started_at: float
+    duration: float
+    error: BaseException | None
+
+
+class PipelineRun(NamedTuple):
+    pipeline: str
+    started_at: float
+    duration: float
+    stages: dict[str, StageResult]
+    results: dict[str, Any]
+
+    @property
+    def failed(self) -> list[str]:
+        return [name for name, stage in self.stages.items() if stage.error is not None]
+
+
+class Pipeline:
+    """Runs a DAG of async stages once per cycle.
+
+    Every stage starts as soon as all of its dependencies have finished, so independent
+    branches overlap and shared stages run once however many stages consume them. A failed
+    stage fails its dependents; unrelated branches still complete.
+    """
+
+    def __init__(self, name: str, stages: list[Stage]):
+        self.name = name
+        self.stages = {stage.name: stage for stage in stages}
+        if len(self.stages) != len(stages):
+            raise ValueError(f"Pipeline '{name}' has duplicate stage names")
+        for stage in stages:
+            for dependency in stage.depends_on:
+                if dependency not in self.stages:
+                    raise ValueError(f"Stage '{stage.name}' depends on unknown stage '{dependency}'")
+        self._check_acyclic()
+        self.last_run: PipelineRun | None = None
+
+    def _check_acyclic(self) -> None:
+        visiting, done = set(), set()
+
+        def visit(name: str) -> None:
+            if name in done:
+                return
+            if name in visiting:
+                raise ValueError(f"Pipeline '{self.name}' has a cycle through '{name}'")
+            visiting.add(name)
+            for dependency in self.stages[name].depends_on:
+                visit(dependency)
+            visiting.discard(name)
+            done.add(name)
+
+        for name in self.stages:
+            visit(name)
+
+    async def run(self) -> PipelineRun:
+        started_at = time.time()
+        start = time.perf_counter()
+        tasks: dict[str, asyncio.Task] = {}
+        timings: dict[str, StageResult] = {}
+
+        async def run_stage(stage: Stage) -> Any:
+            inputs = {}
+            try:
+                for dependency in stage.depends_on:
+                    inputs[dependency] = await tasks[dependency]
+            except BaseException as exc:
+                # Skipped because a dependency failed; carries the dependency's error.
+                timings[stage.name] = StageResult(stage.name, time.time(), 0.0, exc)
+                raise
+
+            stage_started_at = time.time()
+            stage_start = time.perf_counter()
+            error = None
+            try:
+                return await stage.run(inputs)
+            except BaseException as exc:
+                error = exc
+                raise
+            finally:
+                duration = time.perf_counter() - stage_start
+                timings[stage.name] = StageResult(stage.name, stage_started_at, duration, error)
+                PIPELINE_STAGE_SECONDS.labels(self.name, stage.name).observe(duration)
+
+        for stage in self.stages.values():
+            tasks[stage.name] = asyncio.create_task(run_stage(stage), name=f"{self.name}:{stage.name}")
+        outcomes = await asyncio.gather(*tasks.values(), return_exceptions=True)
+
+        run = PipelineRun(
+            pipeline=self.name,
+            started_at=started_at,
+            duration=time.perf_counter() - start,
+            stages={name: timings[name] for name in self.stages},
+            results={
+                name: outcome
+                for name, outcome in zip(tasks, outcomes)
+                if not isinstance(outcome, BaseException)
+            },
+        )
+        self.last_run = run
+
+        summary = ", ".join(
+            f"{name} {stage.duration:.2f}s" + (" (failed)" if stage.error else "")
+            for name, stage in run.stages.items()
+        )
+        print(f"[PIPELINE] {self.name} finished in {run.duration:.2f}s: {summary}", flush=True)
+
+        root_causes = [
+            stage.error for stage in run.stages.values()
+            if stage.error is not None and not any(
+                run.stages[dependency].error is stage.error for dependency in self.stages[stage.name].depends_on
+            )
+        ]
+        if root_causes:
+            raise root_causes[0]
+        return run
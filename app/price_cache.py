@@ -0,0 +1,143 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Generic, Hashable, TypeVar
+
+from app import cache
+from app.instrumentation import PRICE_CACHE_EVICTIONS, PRICE_CACHE_LOOKUPS
+
+V = TypeVar("V")
+
+_MISSING = object()
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.value: Any = None
+        self.error: BaseException | None = None
+
+
+class PriceCache(Generic[V]):
+    """Bounded in-process cache with per-entry TTL, LRU eviction and single-flight fills.
+
+    When ``shared_prefix`` is set, entries are also kept in Redis so other processes can
+    reuse a fill instead of repeating it; ``encode``/``decode`` map values to JSON.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        ttl: float,
+        max_entries: int,
+        shared_prefix: str | None = None,
+        encode: Callable[[V], Any] | None = None,
+        decode: Callable[[Any], V] | None = None,
+    ):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.shared_prefix = shared_prefix
+        self._encode = encode
+        self._decode = decode
+        self._entries: OrderedDict[Hashable, tuple[float, V]] = OrderedDict()
+        self._inflight: dict[Hashable, _Flight] = {}
+        self._lock = threading.Lock()
+        # ``name`` labels this cache's lookup and eviction counters.
+        self._lookups = {
+            result: PRICE_CACHE_LOOKUPS.labels(name, result) for result in ("hit", "shared_hit", "coalesced", "miss")
+        }
+        self._evictions = PRICE_CACHE_EVICTIONS.labels(name)
+
+    def _get_local(self, key: Hashable) -> Any:
+        entry = self._entries.get(key)
+        if entry is None:
+            return _MISSING
+        expires_at, value = entry
+        if expires_at <= time.time():
+            del self._entries[key]
+            return _MISSING
+        self._entries.move_to_end(key)
+        return value
+
+    def _put_local(self, key: Hashable, value: V, ttl: float) -> None:
+        self._entries[key] = (time.time() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._evictions.inc()
+
+    def _shared_key(self, key: Hashable) -> str:
+        return f"{self.shared_prefix}:{key}"
+
+    def get(self, key: Hashable) -> V | None:
+        with self._lock:
+            value = self._get_local(key)
+        return None if value is _MISSING else value
+
+    def put(self, key: Hashable, value: V, ttl: float | None = None) -> None:
+        ttl = self.ttl if ttl is None else ttl
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._put_local(key, value, ttl)
+        if self.shared_prefix:
+            cache.set_json(self._shared_key(key), self._encode(value), ex=max(int(ttl), 1), local=False)
+
+    def invalidate(self, key: Hashable) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+        if self.shared_prefix:
+            cache.delete(self._shared_key(key))
+
+    def get_or_fill(
+        self,
+        key: Hashable,
+        fill: Callable[[], V],
+        ttl_of: Callable[[V], float] | None = None,
+    ) -> V:
+        """Return the cached value, or fill it exactly once no matter how many threads ask.
+
+        ``ttl_of`` lets a value report its own remaining lifetime (e.g. from its fetch time).
+        """
+        with self._lock:
+            value = self._get_local(key)
+            if value is not _MISSING:
+                self._lookups["hit"].inc()
+                return value
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = _Flight()
+            else:
+                self._lookups["coalesced"].inc()
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            value = _MISSING
+            if self.shared_prefix:
+                shared = cache.get_json(self._shared_key(key), local=False)
+                if shared is not None:
+                    value = self._decode(shared)
+                    self._lookups["shared_hit"].inc()
+            if value is _MISSING:
+                self._lookups["miss"].inc()
+                value = fill()
+                ttl = self.ttl if ttl_of is None else ttl_of(value)
+                self.put(key, value, ttl)
+            else:
+                with self._lock:
+                    self._put_local(key, value, self.ttl if ttl_of is None else ttl_of(value))
+            flight.value = value
+            return value
+        except BaseException as exc:
+            flight.error = exc
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            flight.done.set()
@@ -0,0 +1,97 @@
+from functools import lru_cache
+
+import numpy as np
+
+from app.sde import Item, SdeIndex, items_for_index, load_sde_index
+
+
+class BomMatrix:
+    """Bill of materials as a CSR matrix: one row per blueprint, one column per material type.
+
+    ``indptr``/``indices``/``data`` follow the usual CSR layout, so a row's materials are
+    ``indices[indptr[row]:indptr[row + 1]]`` with quantities at the same positions in ``data``.
+    """
+
+    def __init__(self, items: list[Item]):
+        material_ids = sorted({material.type_id for item in items for material in item.materials})
+        columns = {type_id: col for col, type_id in enumerate(material_ids)}
+
+        indptr = [0]
+        indices: list[int] = []
+        data: list[float] = []
+        for item in items:
+            for material in item.materials:
+                indices.append(columns[material.type_id])
+                data.append(material.quantity)
+            indptr.append(len(indices))
+
+        self.material_ids = np.array(material_ids, dtype=np.int64)
+        self.product_ids = np.fromiter((item.type_id for item in items), dtype=np.int64, count=len(items))
+        self.blueprint_ids = np.fromiter((item.blueprint_id for item in items), dtype=np.int64, count=len(items))
+        self.indptr = np.array(indptr, dtype=np.int64)
+        self.indices = np.array(indices, dtype=np.int64)
+        self.data = np.array(data, dtype=np.float64)
+        # Row of every stored entry; turns the sparse mat-vec into one weighted bincount.
+        self._entry_rows = np.repeat(np.arange(len(items)), np.diff(self.indptr))
+        self._rows = {blueprint_id: row for row, blueprint_id in enumerate(self.blueprint_ids.tolist())}
+
+        # Inverse (CSC) view: for material column c, consuming rows are
+        # _consumer_rows[_consumer_indptr[c]:_consumer_indptr[c + 1]].
+        order = np.argsort(self.indices, kind="stable")
+        self._consumer_rows = self._entry_rows[order]
+        self._consumer_indptr = np.searchsorted(self.indices[order], np.arange(len(material_ids) + 1))
+
+    def __len__(self) -> int:
+        return len(self.product_ids)
+
+    def production_costs(self, material_prices: np.ndarray) -> np.ndarray:
+        """Production cost of every row, given prices aligned with ``material_ids``."""
+        return np.bincount(
+            self._entry_rows,
+            weights=self.data * material_prices[self.indices],
+            minlength=len(self),
+        )
+
+    def production_costs_for(self, rows: np.ndarray, material_prices: np.ndarray) -> np.ndarray:
+        """Production cost of ``rows`` only, touching just their stored entries."""
+        starts = self.indptr[rows]
+        lengths = self.indptr[rows + 1] - starts
+        owners = np.repeat(np.arange(len(rows)), lengths)
+        entries = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+        return np.bincount(
+            owners,
+            weights=self.data[entries] * material_prices[self.indices[entries]],
+            minlength=len(rows),
+        )
+
+    def rows_using(self, material_columns: np.ndarray) -> np.ndarray:
+        """Sorted, unique rows that consume any of ``material_columns``."""
+        starts = self._consumer_indptr[material_columns]
+        lengths = self._consumer_indptr[material_columns + 1] - starts
+        entries = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+        return np.unique(self._consumer_rows[entries])
+
+    def rows_for(self, items: list[Item]) -> np.ndarray | None:
+        """Row indexes for ``items``, or None when any of them is not part of this matrix."""
+        rows = [self._rows.get(item.blueprint_id) for item in items]
+        if any(row is None for row in rows):
+            return None
+        return np.array(rows, dtype=np.int64)
+
+
+@lru_cache(maxsize=2)
+def _bom_from_index(index: SdeIndex) -> BomMatrix:
+    return BomMatrix(items_for_index(index))
+
+
+def get_bom_matrix(items: list[Item]) -> tuple[BomMatrix, np.ndarray]:
+    """Return a BOM matrix covering ``items`` and the row of each item within it.
+
+    Items drawn from the compiled SDE share one catalog-wide matrix built per index.
+    """
+    bom = _bom_from_index(load_sde_index())
+    rows = bom.rows_for(items)
+    if rows is None:
+        bom = BomMatrix(items)
+        rows = np.arange(len(items))
+    return bom, rows
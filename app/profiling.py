@@ -0,0 +1,233 @@
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Iterator, Optional
+
+METRICS_TARGET = "metrics"
+MODES = ("sampling", "cprofile")
+DEFAULT_SAMPLE_INTERVAL = 0.005
+# Finished sessions kept for retrieval after the request that armed them has gone.
+MAX_FINISHED_SESSIONS = 20
+
+
+def job_target(name: str) -> str:
+    return f"job:{name}"
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class _Sampler:
+    """Records the stacks of running threads every ``interval`` seconds on a daemon thread.
+
+    Sampling reads ``sys._current_frames`` and never hooks the profiled code, so it also
+    covers work the profiled thread hands to executor threads when ``thread_id`` is None.
+    """
+
+    def __init__(self, interval: float, thread_id: Optional[int]):
+        self.interval = interval
+        self.thread_id = thread_id
+        self.stacks: Counter[str] = Counter()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profiler-sampler", daemon=True)
+
+    def _run(self) -> None:
+        own = threading.get_ident()
+        while not self._stopped.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own or (self.thread_id is not None and thread_id != self.thread_id):
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame))
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> Counter[str]:
+        self._stopped.set()
+        self._thread.join()
+        return self.stacks
+
+
+class ProfileSession:
+    """Profiles the next ``count`` executions of a target and accumulates one report.
+
+    ``sampling`` yields collapsed stacks (``frame;frame;frame count`` lines, ready for
+    flamegraph tools); ``cprofile`` yields pstats text sorted by cumulative time.
+    """
+
+    def __init__(self, target: str, mode: str, count: int, interval: float, all_threads: bool):
+        if mode not in MODES:
+            raise ValueError(f"Unknown profiling mode '{mode}'")
+        self.id = uuid.uuid4().hex[:12]
+        self.target = target
+        self.mode = mode
+        self.remaining = count
+        self.interval = interval
+        self.all_threads = all_threads
+        self.captured = 0
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.cancelled = False
+        self.done = threading.Event()
+        self._active = 0
+        self._stacks: Counter[str] = Counter()
+        self._stats: Optional[pstats.Stats] = None
+        self._lock = threading.Lock()
+
+    def _claim(self) -> bool:
+        with self._lock:
+            if self.remaining <= 0 or self.cancelled:
+                return False
+            self.remaining -= 1
+            self._active += 1
+            return True
+
+    def _release(self) -> None:
+        with self._lock:
+            self._active -= 1
+            self.captured += 1
+            finished = self._active == 0 and (self.remaining <= 0 or self.cancelled)
+        if finished:
+            self._finish()
+
+    def _finish(self) -> None:
+        self.finished_at = time.time()
+        _disarm(self)
+        self.done.set()
+
+    def cancel(self) -> None:
+        with self._lock:
+            self.cancelled = True
+            idle = self._active == 0
+        if idle:
+            self._finish()
+
+    @contextmanager
+    def capture(self) -> Iterator[None]:
+        """Profile the enclosed block, on the calling thread (or all threads when sampling a job)."""
+        if self.mode == "cprofile":
+            profile = cProfile.Profile()
+            profile.enable()
+            try:
+                yield
+            finally:
+                profile.disable()
+                with self._lock:
+                    if self._stats is None:
+                        self._stats = pstats.Stats(profile)
+                    else:
+                        self._stats.add(profile)
+                self._release()
+        else:
+            sampler = _Sampler(self.interval, None if self.all_threads else threading.get_ident())
+            sampler.start()
+            try:
+                yield
+            finally:
+                stacks = sampler.stop()
+                with self._lock:
+                    self._stacks.update(stacks)
+                self._release()
+
+    def report(self, limit: int = 100) -> str:
+        with self._lock:
+            if self.mode == "sampling":
+                return "".join(f"{stack} {count}\n" for stack, count in self._stacks.most_common())
+            if self._stats is None:
+                return ""
+            out = io.StringIO()
+            self._stats.stream = out
+            self._stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(limit)
+            return out.getvalue()
+
+    def status(self) -> dict[str, Any]:
+        return {
+            "id": self.id,
+            "target": self.target,
+            "mode": self.mode,
+            "remaining": self.remaining,
+            "captured": self.captured,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+            "state": "cancelled" if self.cancelled else "done" if self.done.is_set() else "armed",
+        }
+
+
+# Armed sessions by target; empty whenever nothing is being profiled.
+_armed: dict[str, ProfileSession] = {}
+_sessions: OrderedDict[str, ProfileSession] = OrderedDict()
+_lock = threading.Lock()
+
+
+def arm(
+    target: str,
+    mode: str = "sampling",
+    count: int = 1,
+    interval: float = DEFAULT_SAMPLE_INTERVAL,
+    all_threads: bool = False,
+) -> ProfileSession:
+    """Profile the next ``count`` executions of ``target``; replaces a session already armed for it."""
+    session = ProfileSession(target, mode, max(1, count), interval, all_threads)
+    with _lock:
+        previous = _armed.get(target)
+        _armed[target] = session
+        _sessions[session.id] = session
+        # Armed sessions are never evicted; only the oldest finished ones beyond the limit.
+        finished = [session_id for session_id, armed in _sessions.items() if armed.done.is_set()]
+        for session_id in finished[:max(0, len(finished) - MAX_FINISHED_SESSIONS)]:
+            del _sessions[session_id]
+    if previous is not None:
+        previous.cancel()
+    return session
+
+
+def _disarm(session: ProfileSession) -> None:
+    with _lock:
+        if _armed.get(session.target) is session:
+            del _armed[session.target]
+
+
+def get_session(session_id: str) -> Optional[ProfileSession]:
+    return _sessions.get(session_id)
+
+
+def claim(target: str) -> Optional[ProfileSession]:
+    """The session that should profile this execution of ``target``, if any.
+
+    Costs one dictionary truth test while nothing is armed.
+    """
+    if not _armed:
+        return None
+    session = _armed.get(target)
+    if session is None or not session._claim():
+        return None
+    return session
+
+
+def run_sync(session: Optional[ProfileSession], func: Callable, *args: Any) -> Any:
+    if session is None:
+        return func(*args)
+    with session.capture():
+        return func(*args)
+
+
+async def run_async(session: Optional[ProfileSession], func: Callable[[], Awaitable[Any]]) -> Any:
+    if session is None:
+        return await func()
+    with session.capture():
+        return await func()
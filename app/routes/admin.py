@@ -0,0 +1,106 @@
+import asyncio
+import secrets
+from datetime import datetime, timezone
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
+
+from app import profiling
+from app.config import settings
+from app.coordination import is_leader
+
+
+def require_admin(authorization: str | None = Header(default=None)) -> None:
+    # Without a configured token the admin surface does not exist.
+    if not settings.admin_token:
+        raise HTTPException(status_code=404)
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not secrets.compare_digest(token.encode(), settings.admin_token.encode()):
+        raise HTTPException(status_code=401, detail="Invalid admin token", headers={"WWW-Authenticate": "Bearer"})
+
+
+router = APIRouter(prefix="/admin", dependencies=[Depends(require_admin)])
+
+# Sampling faster than 1ms would mostly profile the sampler itself, which holds the GIL while it walks stacks.
+MIN_SAMPLE_INTERVAL_MS = 1
+MAX_SAMPLE_INTERVAL_MS = 1000
+MAX_PROFILED_SCRAPES = 1000
+
+
+def _check_mode(mode: str) -> None:
+    if mode not in profiling.MODES:
+        raise HTTPException(status_code=400, detail=f"mode must be one of {', '.join(profiling.MODES)}")
+
+
+async def _session_response(session: profiling.ProfileSession, wait: float, limit: int):
+    if wait > 0:
+        await asyncio.to_thread(session.done.wait, wait)
+    if not session.done.is_set():
+        return JSONResponse(session.status(), status_code=202)
+    return PlainTextResponse(
+        session.report(limit),
+        headers={"X-Profile-Session": session.id, "X-Profile-Captured": str(session.captured)},
+    )
+
+
+@router.post("/profile/jobs/{name}")
+async def profile_job(
+    name: str,
+    request: Request,
+    mode: str = "sampling",
+    run_now: bool = False,
+    wait: float = 0,
+    interval_ms: float = Query(
+        profiling.DEFAULT_SAMPLE_INTERVAL * 1000, ge=MIN_SAMPLE_INTERVAL_MS, le=MAX_SAMPLE_INTERVAL_MS
+    ),
+    limit: int = 100,
+):
+    """Profile the next run of a scheduler job on this replica, optionally starting it now."""
+    _check_mode(mode)
+    job = request.app.state.scheduler.get_job(name)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job '{name}'")
+    # cProfile hooks one thread; for a coroutine job that is the loop, idle while its work runs elsewhere.
+    if mode == "cprofile" and getattr(job.func, "is_coroutine", False):
+        raise HTTPException(status_code=400, detail=f"Job '{name}' runs on the event loop; use sampling mode")
+    if not is_leader():
+        raise HTTPException(status_code=409, detail="Jobs only run on the leader replica")
+
+    # Jobs hand most work to executor threads, so sampling covers every thread.
+    session = profiling.arm(profiling.job_target(name), mode, 1, interval_ms / 1000, all_threads=True)
+    if run_now:
+        job.modify(next_run_time=datetime.now(tz=timezone.utc))
+    return await _session_response(session, wait, limit)
+
+
+@router.post("/profile/metrics")
+async def profile_metrics(
+    requests: int = Query(10, ge=1, le=MAX_PROFILED_SCRAPES),
+    mode: str = "sampling",
+    wait: float = 0,
+    interval_ms: float = Query(
+        profiling.DEFAULT_SAMPLE_INTERVAL * 1000, ge=MIN_SAMPLE_INTERVAL_MS, le=MAX_SAMPLE_INTERVAL_MS
+    ),
+    limit: int = 100,
+):
+    """Profile the next ``requests`` /metrics scrapes served by this replica."""
+    _check_mode(mode)
+    session = profiling.arm(profiling.METRICS_TARGET, mode, requests, interval_ms / 1000)
+    return await _session_response(session, wait, limit)
+
+
+@router.get("/profile/{session_id}")
+async def get_profile(session_id: str, wait: float = 0, limit: int = 100):
+    session = profiling.get_session(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Unknown profiling session")
+    return await _session_response(session, wait, limit)
+
+
+@router.delete("/profile/{session_id}")
+def cancel_profile(session_id: str):
+    session = profiling.get_session(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Unknown profiling session")
+    session.cancel()
+    return session.status()
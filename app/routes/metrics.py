@@ -1,79 +1,52 @@
-from prometheus_client import CONTENT_TYPE_LATEST, Gauge, generate_latest
-from fastapi import Response
-from fastapi import APIRouter
-
-from app.wallet import get_wallet_balance
-from app.market import get_profit_indexes, get_corp_profit_indexes
-from app.sales import get_corp_average_sold_volume
-from app.config import settings
-
-# Gauges follow Prometheus conventions: value is the metric, labels identify the series.
-item_labels = ["item_id", "item_name", "source"]
-
-profit_index_gauge = Gauge("esi_item_profit_index", "Profit index per item", item_labels)
-sell_price_gauge = Gauge("esi_item_sell_price", "Sell price per item", item_labels)
-production_cost_gauge = Gauge("esi_item_production_cost", "Production cost per item", item_labels)
-avg_volume_gauge = Gauge("esi_item_avg_volume", "Average daily volume per item", item_labels)
-blueprint_cost_gauge = Gauge("esi_item_blueprint_cost", "Blueprint cost per item", item_labels)
-return_time_gauge = Gauge("esi_item_return_time_seconds", "Return time per item (seconds)", item_labels)
+import asyncio
 
-wallet_balance_gauge = Gauge(
-    "esi_wallet_balance",
-    "Wallet balance per division",
-    ["division"]
-)
+from prometheus_client import CONTENT_TYPE_LATEST
+from fastapi import Request, Response
+from fastapi import APIRouter
 
-corp_sold_volume_gauge = Gauge(
-    "esi_corp_avg_sold_volume",
-    "Average sold volume per item for the corporation over the configured window (days)",
-    ["item_id", "item_name", "source"],
-)
+from app import profiling
+from app.exposition import get_rendered_metrics
 
 router = APIRouter(prefix="/metrics")
 
 
-def _set_item_metrics(indexes, source: str):
-    for index in indexes:
-        labels = dict(item_id=index.item_id, item_name=index.item_name, source=source)
-        profit_index_gauge.labels(**labels).set(index.profit_index)
-        sell_price_gauge.labels(**labels).set(index.sell_price)
-        production_cost_gauge.labels(**labels).set(index.production_cost)
-        avg_volume_gauge.labels(**labels).set(index.avg_volume)
-        blueprint_cost_gauge.labels(**labels).set(index.blueprint_cost)
-        return_time_gauge.labels(**labels).set(index.return_time_seconds)
-
+def _quality(params: str) -> float:
+    for param in params.split(";"):
+        name, _, value = param.partition("=")
+        if name.strip().lower() == "q":
+            try:
+                return float(value)
+            except ValueError:
+                return 0.0
+    return 1.0
 
-@router.get("/")
-async def metrics():
-    # Clear gauges so removed items go stale and stop emitting.
-    wallet_balance_gauge.clear()
-    profit_index_gauge.clear()
-    sell_price_gauge.clear()
-    production_cost_gauge.clear()
-    avg_volume_gauge.clear()
-    blueprint_cost_gauge.clear()
-    return_time_gauge.clear()
-    corp_sold_volume_gauge.clear()
 
-    balances = get_wallet_balance()
-    for name, balance in balances.items():
-        wallet_balance_gauge.labels(division=name).set(balance)
+def _accepts_gzip(accept_encoding: str) -> bool:
+    # An explicit gzip entry wins over "*"; the wildcard only speaks for codings not listed.
+    wildcard = None
+    for part in accept_encoding.split(","):
+        coding, _, params = part.strip().partition(";")
+        coding = coding.strip().lower()
+        if coding == "gzip":
+            return _quality(params) > 0
+        if coding == "*" and wildcard is None:
+            wildcard = _quality(params) > 0
+    return bool(wildcard)
 
-    profit_indexes = await get_profit_indexes(compute_on_miss=False)
-    if profit_indexes:
-        _set_item_metrics(profit_indexes, source="market")
 
-    corp_profit_indexes = await get_corp_profit_indexes(compute_on_miss=False)
-    if corp_profit_indexes:
-        _set_item_metrics(corp_profit_indexes, source="corp")
+def _exposition(gzip: bool) -> bytes:
+    # Refresh jobs render ahead of time; only a cold or stale exposition is rendered here.
+    return get_rendered_metrics().exposition(gzip)
 
-    corp_avg_sales = get_corp_average_sold_volume()
-    for sale in corp_avg_sales:
-        corp_sold_volume_gauge.labels(
-            item_id=sale.item_id,
-            item_name=sale.item_name,
-            source="corp",
-        ).set(sale.avg_volume)
 
-    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
-    
+@router.get("/")
+async def metrics(request: Request):
+    gzip = _accepts_gzip(request.headers.get("accept-encoding", ""))
+    # Kept off the loop; profiled only while an admin has armed a metrics session.
+    session = profiling.claim(profiling.METRICS_TARGET)
+    body = await asyncio.to_thread(profiling.run_sync, session, _exposition, gzip)
+
+    headers = {"Vary": "Accept-Encoding"}
+    if gzip:
+        headers["Content-Encoding"] = "gzip"
+    return Response(body, media_type=CONTENT_TYPE_LATEST, headers=headers)
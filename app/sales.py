@@ -1,20 +1,30 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
-from typing import List
+from typing import Iterator, List
 
-from requests import HTTPError
+import httpx
 
+from app.archive import archive_transactions_before
+from app.cache import set_json
 from app.config import settings
 from app.db import SessionLocal
-from app.esi import esi_manager
-from app.models.transaction import CorpTransaction
+from app.esi import esi_async, esi_manager
 from app.crud.transactions import (
-    get_latest_transaction_id,
+    get_ingest_cursor,
+    set_ingest_cursor,
     upsert_transactions,
-    prune_transactions_before,
-    get_sales_sums_since,
+    get_daily_sales_sums_between,
+    ensure_sales_rollup,
 )
 from app.sde import get_type_name
 
+# Bumped after every ingest so other replicas know the sold-volume series moved.
+SALES_INGESTED_KEY = "sales:ingested_at"
+
+_write_lock = threading.Lock()
+
 
 class CorpSoldAverage:
     def __init__(self, item_id: int, item_name: str, avg_volume: float):
@@ -23,59 +33,49 @@ class CorpSoldAverage:
         self.avg_volume = avg_volume
 
 
-def _fetch_transactions_for_division(division: int, last_seen: int | None) -> list[CorpTransaction]:
-    esi = esi_manager.get_client()
-    all_new: list[CorpTransaction] = []
+def _transaction_row(division: int, row: dict) -> dict:
+    return dict(
+        transaction_id=row["transaction_id"],
+        division=division,
+        type_id=row["type_id"],
+        quantity=row["quantity"],
+        is_buy=row["is_buy"],
+        unit_price=row["unit_price"],
+        date=datetime.fromisoformat(row["date"].replace("Z", "+00:00")),
+    )
+
+
+def _iter_transaction_pages(corporation_id: int, division: int, last_seen: int | None) -> Iterator[list[dict]]:
+    """Yield each page's new transactions, newest first, until last_seen is reached."""
     from_id = None
     seen = 0
     pages = 0
     last_from_id = None
 
     while True:
-        try:
-            params = dict(
-                corporation_id=settings.corp_id,
-                division=division,
-            )
-            if from_id:
-                params["from_id"] = from_id
-
-            batch = esi.get_op(
-                "get_corporations_corporation_id_wallets_division_transactions",
-                **params,
-                _request_options={"timeout": 15},
-            )
-        except HTTPError as e:
-            if e.response.status_code in (401, 403):
-                print(f"[SALES] Unauthorized for division {division}; check roles/scope")
-                return []
-            raise
+        batch = esi_async.run(esi_async.get_op(
+            "get_corporations_corporation_id_wallets_division_transactions",
+            _cache=False,
+            corporation_id=corporation_id,
+            division=division,
+            from_id=from_id,
+        ))
 
         if not batch:
             print(f"[SALES] Division {division}: no more transactions (pages={pages}, seen={seen})", flush=True)
             break
 
         # ESI returns most recent first; stop when we hit older/equal to last_seen
-        stop = False
-        for row in batch:
-            txn_id = row["transaction_id"]
-            if last_seen and txn_id <= last_seen:
-                stop = True
-                continue
-            all_new.append(
-                CorpTransaction(
-                    transaction_id=txn_id,
-                    division=division,
-                    type_id=row["type_id"],
-                    quantity=row["quantity"],
-                    is_buy=row["is_buy"],
-                    unit_price=row["unit_price"],
-                    date=datetime.fromisoformat(row["date"].replace("Z", "+00:00")),
-                )
-            )
-            seen += 1
-
-        if stop:
+        new_rows = [
+            _transaction_row(division, row)
+            for row in batch
+            if not last_seen or row["transaction_id"] > last_seen
+        ]
+        seen += len(new_rows)
+        if new_rows:
+            yield new_rows
+
+        if len(new_rows) < len(batch):
             break
 
         pages += 1
@@ -93,44 +93,83 @@ def _fetch_transactions_for_division(division: int, last_seen: int | None) -> li
             break
 
     print(f"[SALES] Division {division}: fetched {seen} new transactions", flush=True)
-    return all_new
+
+
+def _ingest_division(corporation_id: int, division: int) -> int:
+    """Stream one division's new pages into bounded batch inserts; returns rows inserted."""
+    batch_size = max(1, settings.corp_sales_batch_size)
+    inserted = 0
+    newest_id = None
+
+    with SessionLocal() as db:
+        last_seen = get_ingest_cursor(db, division)
+        print(f"[SALES] Division {division}: last_seen={last_seen}", flush=True)
+
+        try:
+            for rows in _iter_transaction_pages(corporation_id, division, last_seen):
+                if newest_id is None:
+                    newest_id = rows[0]["transaction_id"]
+                for start in range(0, len(rows), batch_size):
+                    # SQLite allows one writer; divisions fetch in parallel but take turns committing.
+                    with _write_lock:
+                        inserted += upsert_transactions(db, rows[start:start + batch_size])
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code in (401, 403):
+                print(f"[SALES] Unauthorized for division {division}; check roles/scope")
+                return inserted
+            raise
+
+        # Only a completed walk advances the cursor, so an interrupted backlog is re-walked
+        # from the top next time instead of leaving a gap below the newest inserted row.
+        if newest_id is not None:
+            with _write_lock:
+                set_ingest_cursor(db, division, newest_id)
+
+    print(f"[SALES] Division {division}: inserted {inserted} rows", flush=True)
+    return inserted
+
+
+def get_sales_corporation_id() -> int | None:
+    """Corporation whose ledger is ingested: CORP_ID, else the first pooled corporation."""
+    if settings.corp_id:
+        return int(settings.corp_id)
+    return next(iter(esi_manager.corporations()), None)
 
 
 def ingest_corp_sales() -> None:
-    if not settings.corp_id:
-        print("[SALES] Skipping ingest; corp_id not set")
+    corporation_id = get_sales_corporation_id()
+    if corporation_id is None:
+        print("[SALES] Skipping ingest; no corporation authenticated")
+        return
+
+    divisions = []
+    try:
+        divisions = [
+            div["division"]
+            for div in esi_async.run(esi_async.get_op(
+                "get_corporations_corporation_id_divisions",
+                corporation_id=corporation_id,
+            ))["wallet"]
+        ]
+    except httpx.HTTPStatusError as e:
+        print(f"[SALES] Unable to fetch divisions: {e}")
         return
 
+    print(f"[SALES] Divisions detected: {divisions}", flush=True)
     with SessionLocal() as db:
-        divisions = []
-        try:
-            divisions = [
-                div["division"]
-                for div in esi_manager.get_client().get_op(
-                    "get_corporations_corporation_id_divisions",
-                    corporation_id=settings.corp_id,
-                )["wallet"]
-            ]
-        except HTTPError as e:
-            print(f"[SALES] Unable to fetch divisions: {e}")
-            return
-
-        print(f"[SALES] Divisions detected: {divisions}", flush=True)
-        total_new = 0
-        for division in divisions:
-            last_seen = get_latest_transaction_id(db, division)
-            print(f"[SALES] Division {division}: last_seen={last_seen}", flush=True)
-            new_txns = _fetch_transactions_for_division(division, last_seen)
-            if new_txns:
-                inserted = upsert_transactions(db, new_txns)
-                total_new += inserted
-                print(f"[SALES] Division {division}: inserted {inserted} rows", flush=True)
-
-        print(f"[SALES] Ingested {total_new} new corp transactions", flush=True)
-
-        cutoff = datetime.now(timezone.utc) - timedelta(days=settings.corp_sales_window_days)
-        pruned = prune_transactions_before(db, cutoff)
-        print(f"[SALES] Pruned {pruned} old transactions (cutoff {cutoff.isoformat()})", flush=True)
+        ensure_sales_rollup(db)
+
+    total_new = 0
+    with ThreadPoolExecutor(max_workers=max(1, len(divisions))) as pool:
+        for inserted in pool.map(lambda division: _ingest_division(corporation_id, division), divisions):
+            total_new += inserted
+
+    print(f"[SALES] Ingested {total_new} new corp transactions", flush=True)
+
+    cutoff = datetime.now(timezone.utc) - timedelta(days=settings.corp_sales_window_days)
+    archived = archive_transactions_before(cutoff)
+    print(f"[SALES] Archived {archived} old transactions (cutoff {cutoff.isoformat()})", flush=True)
+    set_json(SALES_INGESTED_KEY, time.time())
 
 
 def get_corp_average_sold_volume() -> List[CorpSoldAverage]:
@@ -138,9 +177,11 @@ def get_corp_average_sold_volume() -> List[CorpSoldAverage]:
     if window_days <= 0:
         return []
 
-    cutoff = datetime.now(timezone.utc) - timedelta(days=window_days)
+    # The last window_days complete UTC days, read from the pre-summed rollup; today is still
+    # partial, the same convention as market history volumes.
+    today = datetime.now(timezone.utc).date()
     with SessionLocal() as db:
-        sums = get_sales_sums_since(db, cutoff)
+        sums = get_daily_sales_sums_between(db, today - timedelta(days=window_days), today)
 
     averages: list[CorpSoldAverage] = []
     for type_id, total_qty in sums:
@@ -1,19 +1,16 @@
-from fastapi import HTTPException
+import numpy as np
 from pydantic import BaseModel
-from requests import HTTPError
 from app.cache import get_json, set_json
-from app.esi import esi_manager
-from app.utils.parse import parse_jsonl
-import os
-import json
-from app.config import settings
-import asyncio
-from concurrent.futures import ThreadPoolExecutor
+from app.esi import esi_async
+from app.orderbook import get_order_book, get_region_ids
+from app.sde_index import BlueprintRow, SdeIndex, load_index
+from app.snapshots import store_snapshot
+from app.utils.parse import parse_jsonl_parallel
 from functools import lru_cache
+from typing import Iterator
 
 TYPES_PATH = "./data/sde/types.jsonl"
 BLUEPRINTS_PATH = "./data/sde/blueprints.jsonl"
-PARSED_PATH = "./data/sde/parsed/items.json"
 MARKET_TYPE_CACHE_KEY = "sde:market_order_type_ids"
 CORP_BLUEPRINT_CACHE_KEY = "sde:corp_blueprint_type_ids"
 CHARACTER_SKILLS_CACHE_KEY = "sde:character_skills"
@@ -22,8 +19,6 @@ MARKET_CACHE_TTL = 6 * 60 * 60
 CORP_BP_CACHE_TTL = 60 * 60
 SKILL_CACHE_TTL = 12 * 60 * 60
 
-executor = ThreadPoolExecutor(max_workers=4)
-
 class Material(BaseModel):
     type_id: int
     name: str
@@ -41,93 +36,44 @@ class Item(BaseModel):
     blueprint_skills: list[Skills]
 
 
-def _get_market_order_type_ids() -> set[int]:
+def get_market_order_type_ids() -> set[int]:
     cached = get_json(MARKET_TYPE_CACHE_KEY)
     if cached:
         return set(cached)
 
-    esi = esi_manager.get_client()
-
-    page = 1
-    type_ids = set()
-
-    while True:
-        try:
-            orders = esi.get_op(
-                "get_markets_region_id_orders",
-                region_id=settings.region_id,
-                page=page,
-                order_type="sell",
-            )
-        except HTTPError as e:
-            if e.response.status_code == 404:
-                break
-            raise
-
-        if not orders:
-            break
-
-        for order in orders:
-            type_ids.add(order["type_id"])
+    # Shares the region sweeps that market pricing reads from; a type sold in any region qualifies.
+    type_ids = set().union(*(get_order_book(region_id).sell_type_ids() for region_id in get_region_ids()))
 
-        page += 1
-
-    set_json(MARKET_TYPE_CACHE_KEY, list(type_ids), ex=MARKET_CACHE_TTL)
+    store_snapshot(MARKET_TYPE_CACHE_KEY, list(type_ids), ex=MARKET_CACHE_TTL)
     return type_ids
 
 
-def _get_corp_blueprint_type_ids(refresh: bool = False) -> set[int]:
-    cached = get_json(CORP_BLUEPRINT_CACHE_KEY)
+def get_corp_blueprint_type_ids(corporation_id: int, refresh: bool = False) -> set[int]:
+    cache_key = f"{CORP_BLUEPRINT_CACHE_KEY}:{corporation_id}"
+    cached = get_json(cache_key)
     if cached and not refresh:
         return set(cached)
 
-    if not settings.corp_id:
-        return set()
-
-    esi = esi_manager.get_client()
-
-    page = 1
-    type_ids = set()
-
-    while True:
-        try:
-            blueprints = esi.get_op(
-                "get_corporations_corporation_id_blueprints",
-                corporation_id=settings.corp_id,
-                page=page,
-            )
-        except HTTPError as e:
-            if e.response.status_code == 404:
-                break
-            raise
+    blueprints = esi_async.run(
+        esi_async.get_paged("get_corporations_corporation_id_blueprints", corporation_id=corporation_id)
+    )
+    type_ids = {bp["type_id"] for bp in blueprints}
 
-        if not blueprints:
-            break
-
-        for bp in blueprints:
-            type_ids.add(bp["type_id"])
-
-        page += 1
-
-    set_json(CORP_BLUEPRINT_CACHE_KEY, list(type_ids), ex=CORP_BP_CACHE_TTL)
-    print("[SDE] Corp blueprint types: ", len(type_ids))
+    set_json(cache_key, list(type_ids), ex=CORP_BP_CACHE_TTL)
+    print(f"[SDE] Corp {corporation_id} blueprint types: ", len(type_ids))
     return type_ids
 
 
-def _get_character_skills() -> list[Skills]:
-    cache_key = f"{CHARACTER_SKILLS_CACHE_KEY}:{settings.character_id}"
+def get_character_skills(character_id: str) -> list[Skills]:
+    cache_key = f"{CHARACTER_SKILLS_CACHE_KEY}:{character_id}"
     cached = get_json(cache_key)
     if cached:
         return [Skills(**skill) for skill in cached]
 
-    if not settings.character_id:
-        return []
-
-    esi = esi_manager.get_client()
-    skills = esi.get_op(
+    skills = esi_async.run(esi_async.get_op(
         "get_characters_character_id_skills",
-        character_id=settings.character_id,
-    )["skills"]
+        character_id=character_id,
+    ))["skills"]
     parsed = [
         Skills(skill_id=skill.get("skill_id"), level=skill.get("active_skill_level"))
         for skill in skills
@@ -136,123 +82,151 @@ def _get_character_skills() -> list[Skills]:
     print("Discoverd skills: ", len(parsed))
     return parsed
 
-def _character_has_skills(item: Item, skills: list[Skills] | None = None) -> bool:
-    character_skills = skills or _get_character_skills()
-
-    for blueprint_skill in item.blueprint_skills:
-        if blueprint_skill.skill_id not in [s.skill_id for s in character_skills]:
-            return False
-
-        if blueprint_skill.level > [s.level for s in character_skills if s.skill_id == blueprint_skill.skill_id][0]:
-            return False
-    return True
-
-def _is_blueprint_available(item: Item) -> bool:
-    return item.blueprint_id in _get_market_order_type_ids() and _character_has_skills(item)
-
-def _is_corp_blueprint_owned(item: Item) -> bool:
-    return item.blueprint_id in _get_corp_blueprint_type_ids() and _character_has_skills(item)
-
-def _parse_sde_raw_items() -> list[Item]:
-    item_names = {}
-    for item in parse_jsonl(TYPES_PATH):
-        item_names[item.get("_key")] = item.get("name").get("en")
-
-    items: list[Item] = []
-    for blueprint in parse_jsonl(BLUEPRINTS_PATH):
-        blueprint_id = blueprint.get("blueprintTypeID")
-
-        manufacturing = blueprint.get("activities").get("manufacturing")
+# Marks "no requirement" in the matrix and "untrained" in a character vector;
+# a real requirement (>= 0) is never met by an untrained skill.
+MISSING_SKILL_LEVEL = -1
+
+class SkillMatrix:
+    """Dense blueprints x skills matrix of required levels, row-aligned with the items it was built from."""
+
+    def __init__(self, items: list[Item]):
+        skill_ids = sorted({skill.skill_id for item in items for skill in item.blueprint_skills})
+        self.columns = {skill_id: col for col, skill_id in enumerate(skill_ids)}
+        self.blueprint_ids = np.fromiter((item.blueprint_id for item in items), dtype=np.int64, count=len(items))
+        self.required = np.full((len(items), len(skill_ids)), MISSING_SKILL_LEVEL, dtype=np.int8)
+        for row, item in enumerate(items):
+            for skill in item.blueprint_skills:
+                col = self.columns[skill.skill_id]
+                self.required[row, col] = max(self.required[row, col], skill.level)
+
+    def skill_vector(self, skills: list[Skills]) -> np.ndarray:
+        levels = np.full(len(self.columns), MISSING_SKILL_LEVEL, dtype=np.int8)
+        for skill in skills:
+            col = self.columns.get(skill.skill_id)
+            if col is not None:
+                levels[col] = max(levels[col], skill.level)
+        return levels
+
+    def eligible(self, skills: list[Skills]) -> np.ndarray:
+        """Mask of blueprints whose every requirement is met by ``skills``."""
+        return np.all(self.required <= self.skill_vector(skills), axis=1)
+
+    def eligible_many(self, skill_sets: list[list[Skills]]) -> np.ndarray:
+        """Characters x blueprints eligibility for several skill sets in one comparison."""
+        if not skill_sets:
+            return np.zeros((0, len(self.blueprint_ids)), dtype=bool)
+        levels = np.stack([self.skill_vector(skills) for skills in skill_sets])
+        return np.all(self.required[None, :, :] <= levels[:, None, :], axis=2)
+
+    def blueprint_mask(self, blueprint_ids: set[int]) -> np.ndarray:
+        return np.isin(self.blueprint_ids, np.fromiter(blueprint_ids, dtype=np.int64, count=len(blueprint_ids)))
+
+def _parse_type_names() -> dict[int, str]:
+    # Only the id and English name of each (large, multilingual) type record leave the workers.
+    return {
+        type_id: name
+        for type_id, name in parse_jsonl_parallel(TYPES_PATH, fields=("_key", "name.en"))
+        if name
+    }
+
+def _parse_blueprint_rows(item_names: dict[int, str]) -> Iterator[BlueprintRow]:
+    """Single-product manufacturing blueprints as (blueprint, product, materials, skills) tuples."""
+    for blueprint_id, manufacturing in parse_jsonl_parallel(
+        BLUEPRINTS_PATH, fields=("blueprintTypeID", "activities.manufacturing")
+    ):
         if not manufacturing:
             continue
 
         products = manufacturing.get("products")
         if not products or len(products) > 1:
             continue
-        
+
         type_id = products[0].get("typeID")
-        name = item_names.get(type_id)
-        if not name:
+        if not item_names.get(type_id):
             continue
-        
+
         materials = manufacturing.get("materials")
         if not materials:
             continue
-        
-        materials_list: list[Material] = []
-        for material in materials:
-            material_type_id = material.get("typeID")
-            quantity = material.get("quantity")
-            material_name = item_names.get(material_type_id)
-            if not material_name:
-                continue
-            materials_list.append(Material(type_id=material_type_id, name=material_name, quantity=quantity))
 
         skills = manufacturing.get("skills")
         if not skills:
             continue
 
-        skills_list: list[Skills] = []
-        for skill in skills:
-            skills_list.append(Skills(skill_id=skill.get("typeID"), level=skill.get("level")))
+        yield (
+            blueprint_id,
+            type_id,
+            [
+                (material.get("typeID"), material.get("quantity"))
+                for material in materials
+                if item_names.get(material.get("typeID"))
+            ],
+            [(skill.get("typeID"), skill.get("level")) for skill in skills],
+        )
+
+def _parse_sde_raw_items(item_names: dict[int, str] | None = None) -> list[Item]:
+    if item_names is None:
+        item_names = _parse_type_names()
+
+    return [
+        Item(
+            blueprint_id=blueprint_id,
+            type_id=type_id,
+            name=item_names[type_id],
+            materials=[
+                Material(type_id=material_type_id, name=item_names[material_type_id], quantity=quantity)
+                for material_type_id, quantity in materials
+            ],
+            blueprint_skills=[Skills(skill_id=skill_id, level=level) for skill_id, level in skills],
+        )
+        for blueprint_id, type_id, materials, skills in _parse_blueprint_rows(item_names)
+    ]
 
+def _get_skill_matrix(items: list[Item]) -> SkillMatrix:
+    index = load_sde_index()
+    if items is items_for_index(index):
+        return _skill_matrix_from_index(index)
+    return SkillMatrix(items)
+
+def select_buildable(
+    items: list[Item], blueprint_ids: set[int], skill_sets: list[list[Skills]]
+) -> list[Item]:
+    """Items whose blueprint is in ``blueprint_ids`` and that at least one skill set can build."""
+    matrix = _get_skill_matrix(items)
+    mask = matrix.blueprint_mask(blueprint_ids) & matrix.eligible_many(skill_sets).any(axis=0)
+    return [item for item, keep in zip(items, mask) if keep]
+
+def _compile_sde() -> tuple[dict[int, str], list[BlueprintRow]]:
+    # The index stores plain tuples, so skip building models only to take them apart again.
+    item_names = _parse_type_names()
+    return item_names, list(_parse_blueprint_rows(item_names))
+
+def load_sde_index() -> SdeIndex:
+    return load_index([TYPES_PATH, BLUEPRINTS_PATH], _compile_sde)
+
+@lru_cache(maxsize=2)
+def items_for_index(index: SdeIndex) -> list[Item]:
+    items: list[Item] = []
+    for blueprint_id, type_id, materials, skills in index.blueprints():
         items.append(Item(
-            blueprint_id=blueprint_id, 
-            type_id=type_id, 
-            name=name, 
-            materials=materials_list,
-            blueprint_skills=skills_list
+            blueprint_id=blueprint_id,
+            type_id=type_id,
+            name=index.type_name(type_id),
+            materials=[
+                Material(type_id=material_type_id, name=index.type_name(material_type_id), quantity=quantity)
+                for material_type_id, quantity in materials
+            ],
+            blueprint_skills=[Skills(skill_id=skill_id, level=level) for skill_id, level in skills],
         ))
-
     return items
 
-def _filter_market_available_items(items: list[Item]) -> list[Item]:
-    print("[SDE] Total items: ", len(items))
-    available_ids = _get_market_order_type_ids()
-    skills = _get_character_skills()
-    available_items = [
-        item
-        for item in items
-        if item.blueprint_id in available_ids and _character_has_skills(item, skills)
-    ]
-    print("[SDE] Items with available blueprint: ", len(available_items))
-    return available_items
-
-def _filter_corp_owned_items(items: list[Item]) -> list[Item]:
-    print("[SDE] Total items: ", len(items))
-    owned_ids = _get_corp_blueprint_type_ids(refresh=True)
-    skills = _get_character_skills()
-    corp_items = [
-        item for item in items if item.blueprint_id in owned_ids and _character_has_skills(item, skills)
-    ]
-    print("[SDE] Items with corp-owned blueprint: ", len(corp_items))
-    return corp_items
-
-async def get_items() -> list[Item]:
-    loop = asyncio.get_event_loop()
-    print("[SDE] Processing SDE files")
-    raw_items = await loop.run_in_executor(executor, _parse_sde_raw_items)
-    items = await loop.run_in_executor(executor, _filter_market_available_items, raw_items)
-    print("[SDE] SDE files processed")    
-
-    return items
-
-async def get_corp_blueprint_items() -> list[Item]:
-    loop = asyncio.get_event_loop()
-    print("[SDE] Processing SDE files for corp blueprints")
-    raw_items = await loop.run_in_executor(executor, _parse_sde_raw_items)
-    items = await loop.run_in_executor(executor, _filter_corp_owned_items, raw_items)
-    print("[SDE] Corp blueprint SDE processed")
-    return items
-
-
-@lru_cache(maxsize=1)
-def _type_name_map() -> dict[int, str]:
-    names: dict[int, str] = {}
-    for item in parse_jsonl(TYPES_PATH):
-        names[item.get("_key")] = item.get("name").get("en")
-    return names
+@lru_cache(maxsize=2)
+def _skill_matrix_from_index(index: SdeIndex) -> SkillMatrix:
+    return SkillMatrix(items_for_index(index))
 
+def load_sde_items() -> list[Item]:
+    # Items are rebuilt only when the compiled index changes; callers must treat them as read-only.
+    return items_for_index(load_sde_index())
 
 def get_type_name(type_id: int) -> str:
-    return _type_name_map().get(type_id, str(type_id))
+    return load_sde_index().type_name(type_id) or str(type_id)
@@ -0,0 +1,242 @@
+import bisect
+import hashlib
+import json
+import mmap
+import os
+import struct
+import tempfile
+import threading
+from typing import IO, Callable, Iterator
+
+PARSED_DIR = "./data/sde/parsed"
+MANIFEST_PATH = os.path.join(PARSED_DIR, "current.json")
+
+INDEX_MAGIC = b"LSDE"
+INDEX_VERSION = 1
+# magic, version, blueprints, materials, skills, names, name blob bytes
+_HEADER = struct.Struct("<4sIIIIII")
+
+# (blueprint_id, product type_id, [(material type_id, quantity)], [(skill type_id, level)])
+BlueprintRow = tuple[int, int, list[tuple[int, int]], list[tuple[int, int]]]
+
+
+def _align(offset: int) -> int:
+    return (offset + 7) & ~7
+
+
+def _source_stats(paths: list[str]) -> list[list[int]]:
+    stats = []
+    for path in paths:
+        st = os.stat(path)
+        stats.append([st.st_size, st.st_mtime_ns])
+    return stats
+
+
+def source_hash(paths: list[str]) -> str:
+    digest = hashlib.sha256()
+    for path in paths:
+        with open(path, "rb") as f:
+            while chunk := f.read(1024 * 1024):
+                digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+
+class SdeIndex:
+    """Read-only view over a compiled SDE index file, backed by mmap.
+
+    Every section is a packed little-endian int32 (or uint32) column, so lookups index the
+    mapped pages directly and nothing is decoded until a row is requested.
+    """
+
+    def __init__(self, path: str, source_hash: str):
+        self.path = path
+        self.source_hash = source_hash
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self._mmap)
+
+        magic, version, n_bp, n_mat, n_skill, n_names, blob_len = _HEADER.unpack_from(view, 0)
+        if magic != INDEX_MAGIC or version != INDEX_VERSION:
+            raise ValueError(f"{path} is not a v{INDEX_VERSION} SDE index")
+
+        offset = _HEADER.size
+
+        def column(count: int, fmt: str = "i") -> memoryview:
+            nonlocal offset
+            offset = _align(offset)
+            col = view[offset:offset + count * 4].cast(fmt)
+            offset += count * 4
+            return col
+
+        self.blueprint_ids = column(n_bp)
+        self.product_ids = column(n_bp)
+        self.material_offsets = column(n_bp + 1)
+        self.skill_offsets = column(n_bp + 1)
+        self.material_type_ids = column(n_mat)
+        self.material_quantities = column(n_mat)
+        self.skill_ids = column(n_skill)
+        self.skill_levels = column(n_skill)
+        self.name_type_ids = column(n_names)
+        self.name_offsets = column(n_names + 1, "I")
+        offset = _align(offset)
+        self._name_blob = view[offset:offset + blob_len]
+
+    def __len__(self) -> int:
+        return len(self.blueprint_ids)
+
+    def type_name(self, type_id: int) -> str | None:
+        pos = bisect.bisect_left(self.name_type_ids, type_id)
+        if pos == len(self.name_type_ids) or self.name_type_ids[pos] != type_id:
+            return None
+        start, end = self.name_offsets[pos], self.name_offsets[pos + 1]
+        return bytes(self._name_blob[start:end]).decode("utf-8")
+
+    def blueprints(self) -> Iterator[BlueprintRow]:
+        for row in range(len(self.blueprint_ids)):
+            m_start, m_end = self.material_offsets[row], self.material_offsets[row + 1]
+            s_start, s_end = self.skill_offsets[row], self.skill_offsets[row + 1]
+            yield (
+                self.blueprint_ids[row],
+                self.product_ids[row],
+                list(zip(self.material_type_ids[m_start:m_end], self.material_quantities[m_start:m_end])),
+                list(zip(self.skill_ids[s_start:s_end], self.skill_levels[s_start:s_end])),
+            )
+
+
+def write_index(path: str, names: dict[int, str], blueprints: list[BlueprintRow]) -> None:
+    """Serialize names and blueprint rows, then atomically move the file into place."""
+    name_ids = sorted(type_id for type_id, name in names.items() if name)
+    blob = bytearray()
+    name_offsets = [0]
+    for type_id in name_ids:
+        blob += names[type_id].encode("utf-8")
+        name_offsets.append(len(blob))
+
+    material_offsets, skill_offsets = [0], [0]
+    material_type_ids, material_quantities, skill_ids, skill_levels = [], [], [], []
+    for _, _, materials, skills in blueprints:
+        for type_id, quantity in materials:
+            material_type_ids.append(type_id)
+            material_quantities.append(quantity)
+        for skill_id, level in skills:
+            skill_ids.append(skill_id)
+            skill_levels.append(level)
+        material_offsets.append(len(material_type_ids))
+        skill_offsets.append(len(skill_ids))
+
+    columns = [
+        ("i", [bp[0] for bp in blueprints]),
+        ("i", [bp[1] for bp in blueprints]),
+        ("i", material_offsets),
+        ("i", skill_offsets),
+        ("i", material_type_ids),
+        ("i", material_quantities),
+        ("i", skill_ids),
+        ("i", skill_levels),
+        ("i", name_ids),
+        ("I", name_offsets),
+    ]
+
+    def write(f: IO[bytes]) -> None:
+        f.write(_HEADER.pack(
+            INDEX_MAGIC, INDEX_VERSION, len(blueprints), len(material_type_ids),
+            len(skill_ids), len(name_ids), len(blob),
+        ))
+        for fmt, values in columns:
+            f.write(b"\0" * (_align(f.tell()) - f.tell()))
+            f.write(struct.pack(f"<{len(values)}{fmt}", *values))
+        f.write(b"\0" * (_align(f.tell()) - f.tell()))
+        f.write(blob)
+        f.flush()
+        os.fsync(f.fileno())
+
+    _atomic_write(path, "wb", write)
+
+
+def _atomic_write(path: str, mode: str, write: Callable[[IO], None]) -> None:
+    """Write through a uniquely named temp file, then rename it over ``path``.
+
+    Replicas may compile the same index at once; each writes its own temp file, so none
+    can truncate another's or map a half-written file.
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=f"{os.path.basename(path)}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, mode, encoding=None if "b" in mode else "utf-8") as f:
+            write(f)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    try:
+        os.replace(tmp_path, path)
+    except FileNotFoundError:
+        # Our temp file was swept by a concurrent compile; the target it raced to write is in place.
+        if not os.path.exists(path):
+            raise
+
+
+def _read_manifest() -> dict | None:
+    try:
+        with open(MANIFEST_PATH, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+
+
+def _write_manifest(manifest: dict) -> None:
+    _atomic_write(MANIFEST_PATH, "w", lambda f: json.dump(manifest, f))
+
+
+def _remove_stale_indexes(keep: str) -> None:
+    for name in os.listdir(PARSED_DIR):
+        path = os.path.join(PARSED_DIR, name)
+        if name.startswith("sde-") and name.endswith(".idx") and path != keep:
+            # Safe on POSIX even if another process still has the old file mapped.
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass  # removed by a concurrent compile
+
+
+_current: SdeIndex | None = None
+_current_stats: list[list[int]] | None = None
+_lock = threading.Lock()
+
+
+def load_index(
+    sources: list[str],
+    build: Callable[[], tuple[dict[int, str], list[BlueprintRow]]],
+) -> SdeIndex:
+    """Return the compiled index for the current SDE sources, building it when they change.
+
+    Source files are only re-hashed when their size or mtime moves; the index file name
+    carries the hash, so a new dump produces a new file and the manifest swap is atomic.
+    """
+    global _current, _current_stats
+    stats = _source_stats(sources)
+    if _current is not None and stats == _current_stats:
+        return _current
+
+    with _lock:
+        if _current is not None and stats == _current_stats:
+            return _current
+
+        os.makedirs(PARSED_DIR, exist_ok=True)
+        manifest = _read_manifest()
+        if manifest and manifest.get("stats") == stats and manifest.get("version") == INDEX_VERSION:
+            digest = manifest["hash"]
+        else:
+            digest = source_hash(sources)
+
+        path = os.path.join(PARSED_DIR, f"sde-v{INDEX_VERSION}-{digest}.idx")
+        if not os.path.exists(path):
+            print(f"[SDE] Compiling SDE index {digest}", flush=True)
+            names, blueprints = build()
+            write_index(path, names, blueprints)
+            print(f"[SDE] SDE index compiled: {len(blueprints)} blueprints, {len(names)} names", flush=True)
+
+        index = SdeIndex(path, digest)
+        _write_manifest({"hash": digest, "stats": stats, "version": INDEX_VERSION})
+        _remove_stale_indexes(keep=path)
+
+        _current, _current_stats = index, stats
+        return index
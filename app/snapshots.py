@@ -0,0 +1,51 @@
+import json
+import time
+from datetime import timezone
+from typing import Any
+
+import redis
+from sqlalchemy.exc import SQLAlchemyError
+
+from app import cache
+from app.crud.snapshots import get_checkpoints, save_checkpoint
+from app.db import SessionLocal
+
+
+def store_snapshot(key: str, value: Any, ex: int | None = None) -> None:
+    """``set_json`` plus a SQLite checkpoint, so the snapshot survives a Redis restart.
+
+    A failed checkpoint is logged, not raised; Redis still holds the value.
+    """
+    cache.set_json(key, value, ex=ex)
+    try:
+        with SessionLocal() as db:
+            save_checkpoint(db, key, json.dumps(value), ex)
+    except SQLAlchemyError as exc:
+        print(f"[SNAPSHOT] Checkpoint of {key} failed: {exc}", flush=True)
+
+
+def restore_snapshots() -> int:
+    """Write checkpoints back to Redis for keys it no longer holds; returns how many were restored.
+
+    Keys Redis still has are left alone, since they are at least as new as their checkpoint.
+    Checkpoints past their original expiry are skipped.
+    """
+    with SessionLocal() as db:
+        checkpoints = get_checkpoints(db)
+
+    restored = 0
+    client = cache.get_client()
+    try:
+        for checkpoint in checkpoints:
+            ex = None
+            if checkpoint.ttl_seconds is not None:
+                written_at = checkpoint.updated_at.replace(tzinfo=timezone.utc).timestamp()
+                ex = int(written_at + checkpoint.ttl_seconds - time.time())
+                if ex <= 0:
+                    continue
+            if client.set(checkpoint.key, checkpoint.payload, ex=ex, nx=True):
+                restored += 1
+    except redis.RedisError as exc:
+        print(f"[SNAPSHOT] Restore interrupted: {exc}", flush=True)
+    print(f"[SNAPSHOT] Restored {restored} of {len(checkpoints)} checkpointed snapshots", flush=True)
+    return restored
@@ -0,0 +1,115 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+from preston import Preston
+
+# SSO access tokens live for 20 minutes; renew this long before expiry so callers never wait.
+TOKEN_REFRESH_MARGIN = 2 * 60
+TOKEN_REFRESH_INTERVAL = 30
+
+
+class CharacterToken:
+    """One character's Preston client with its refresh token already decrypted in memory."""
+
+    __slots__ = ("character_id", "client", "lock")
+
+    def __init__(self, character_id: str, client: Preston):
+        self.character_id = character_id
+        self.client = client
+        self.lock = threading.Lock()
+
+    def is_fresh(self, margin: float = 0) -> bool:
+        expires_at = self.client.access_expiration or 0
+        return bool(self.client.access_token) and expires_at - margin > time.time()
+
+
+class TokenManager:
+    """Keeps every pooled character's access token valid ahead of use.
+
+    A background thread renews tokens nearing expiry, so reads are a dictionary lookup and
+    an expiry check. Rotated refresh tokens are handed to ``persist`` on a separate worker,
+    keeping encryption and database writes off the request path.
+    """
+
+    def __init__(self, persist: Callable[[str, str], None]):
+        self._persist = persist
+        self._tokens: dict[str, CharacterToken] = {}
+        self._persist_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="token-persist")
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._refresher: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+
+    def add(self, character_id: str, client: Preston) -> None:
+        self._tokens[character_id] = CharacterToken(character_id, client)
+        self._ensure_refresher()
+        # Let the refresher fetch the first access token now rather than on first use.
+        self._wake.set()
+
+    def __contains__(self, character_id: str) -> bool:
+        return character_id in self._tokens
+
+    def peek(self, character_id: str) -> Optional[str]:
+        """The cached access token if it is still valid; never blocks."""
+        token = self._tokens.get(character_id)
+        if token is not None and token.is_fresh():
+            return token.client.access_token
+        return None
+
+    def access_token(self, character_id: str) -> Optional[str]:
+        token = self._tokens.get(character_id)
+        if token is None:
+            return None
+        if not token.is_fresh():
+            self._refresh(token)
+        return token.client.access_token
+
+    def _refresh(self, token: CharacterToken, margin: float = 0) -> None:
+        with token.lock:
+            # Another caller (or the refresher) may have renewed it while we waited.
+            if token.is_fresh(margin):
+                return
+            previous = token.client.refresh_token
+            current = token.client.access_token, token.client.access_expiration
+            # Force the exchange even when the current token has a little time left.
+            token.client.access_token = None
+            try:
+                token.client._try_refresh_access_token()
+            except Exception:
+                token.client.access_token, token.client.access_expiration = current
+                raise
+            rotated = token.client.refresh_token
+        if rotated and rotated != previous:
+            self._persist_pool.submit(self._persist_rotation, token.character_id, rotated)
+
+    def _persist_rotation(self, character_id: str, refresh_token: str) -> None:
+        try:
+            self._persist(character_id, refresh_token)
+        except Exception as exc:
+            print(f"[ESI] Failed to persist rotated token for {character_id}: {exc}", flush=True)
+
+    def _ensure_refresher(self) -> None:
+        with self._start_lock:
+            if self._refresher is None:
+                self._refresher = threading.Thread(target=self._refresh_loop, name="token-refresh", daemon=True)
+                self._refresher.start()
+
+    def _refresh_loop(self) -> None:
+        while not self._stopped.is_set():
+            self._wake.clear()
+            for token in list(self._tokens.values()):
+                if token.is_fresh(TOKEN_REFRESH_MARGIN):
+                    continue
+                try:
+                    self._refresh(token, TOKEN_REFRESH_MARGIN)
+                except Exception as exc:
+                    print(f"[ESI] Token refresh failed for {token.character_id}: {exc}", flush=True)
+            self._wake.wait(TOKEN_REFRESH_INTERVAL)
+
+    def close(self) -> None:
+        self._stopped.set()
+        self._wake.set()
+        # Flush pending rotations; losing one would strand the character on a revoked token.
+        self._persist_pool.shutdown(wait=True)
@@ -1,8 +1,14 @@
+from functools import lru_cache
+
 from cryptography.fernet import Fernet
 from app.config import settings
 
+@lru_cache(maxsize=1)
+def _fernet() -> Fernet:
+    return Fernet(settings.refresh_token_secret)
+
 def encrypt(text: str):
-    return Fernet(settings.refresh_token_secret).encrypt(text.encode()).decode()
+    return _fernet().encrypt(text.encode()).decode()
 
 def decrypt(text: str):
-    return Fernet(settings.refresh_token_secret).decrypt(text.encode()).decode()
\ No newline at end of file
+    return _fernet().decrypt(text.encode()).decode()
@@ -1,15 +1,121 @@
 import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Iterator, Sequence
 
-def parse_jsonl(path: str) -> dict:
+try:
+    import orjson
+    _loads = orjson.loads
+except ImportError:  # optional speed-up; the stdlib decoder gives identical objects
+    _loads = json.loads
+
+# Files smaller than this are decoded in-process; a pool costs more to start than it saves.
+PARALLEL_MIN_BYTES = 8 * 1024 * 1024
+# Aim for a few chunks per worker so an unlucky chunk of large records does not hold up the rest.
+CHUNKS_PER_WORKER = 4
+
+
+def parse_jsonl(path: str) -> Iterator[dict]:
     with open(path, "r", encoding="utf-8", buffering=1024*1024) as f:
         for line in f:
             line = line.strip()
             if not line:
                 continue
-        
+
             try:
-                obj = json.loads(line)
-            except json.JSONDecodeError as e:
+                obj = _loads(line)
+            except ValueError as e:
                 print(f"Skipping invalid line: {e}")
                 continue
-            yield obj
\ No newline at end of file
+            yield obj
+
+
+def _compile_fields(fields: Sequence[str]) -> tuple[tuple[str, ...], ...]:
+    return tuple(tuple(field.split(".")) for field in fields)
+
+
+def _project(obj: Any, paths: tuple[tuple[str, ...], ...]) -> tuple:
+    values = []
+    for path in paths:
+        value = obj
+        for key in path:
+            value = value.get(key) if isinstance(value, dict) else None
+        values.append(value)
+    return tuple(values)
+
+
+def _parse_lines(data: bytes, paths: tuple[tuple[str, ...], ...] | None) -> list:
+    rows = []
+    for line in data.splitlines():
+        if not line.strip():
+            continue
+        try:
+            obj = _loads(line)
+        except ValueError as e:
+            print(f"Skipping invalid line: {e}")
+            continue
+        rows.append(obj if paths is None else _project(obj, paths))
+    return rows
+
+
+def _parse_chunk(path: str, start: int, end: int, paths: tuple[tuple[str, ...], ...] | None) -> list:
+    with open(path, "rb") as f:
+        f.seek(start)
+        return _parse_lines(f.read(end - start), paths)
+
+
+def _chunk_bounds(path: str, size: int, chunks: int) -> list[tuple[int, int]]:
+    """Split [0, size) into about ``chunks`` byte ranges that each end just after a newline."""
+    step = max(1, size // chunks)
+    bounds = []
+    start = 0
+    with open(path, "rb") as f:
+        while start < size:
+            f.seek(min(start + step, size))
+            f.readline()
+            end = min(f.tell(), size)
+            bounds.append((start, end))
+            start = end
+    return bounds
+
+
+def _available_cpus() -> int:
+    # Respect container CPU affinity where the platform exposes it.
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0)) or 1
+    return os.cpu_count() or 1
+
+
+def parse_jsonl_parallel(
+    path: str,
+    fields: Sequence[str] | None = None,
+    workers: int | None = None,
+) -> list:
+    """Decode a JSONL file in newline-aligned byte chunks across a process pool.
+
+    With ``fields`` (dotted paths such as ``"name.en"``) each record is reduced to a tuple of
+    those values inside the worker, so only the projection is shipped back; missing paths
+    yield None. Records keep their file order.
+    """
+    paths = _compile_fields(fields) if fields is not None else None
+    size = os.path.getsize(path)
+    workers = workers or _available_cpus()
+    if workers <= 1 or size < PARALLEL_MIN_BYTES:
+        return _parse_chunk(path, 0, size, paths)
+
+    bounds = _chunk_bounds(path, size, workers * CHUNKS_PER_WORKER)
+    # Spawned workers import only this module; forking a process full of threads is unsafe.
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=min(workers, len(bounds)), mp_context=context) as pool:
+        chunks = pool.map(
+            _parse_chunk,
+            [path] * len(bounds),
+            [start for start, _ in bounds],
+            [end for _, end in bounds],
+            [paths] * len(bounds),
+        )
+        rows = []
+        for chunk in chunks:
+            rows.extend(chunk)
+    return rows
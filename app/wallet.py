@@ -1,54 +1,57 @@
 import asyncio
 
 from app.cache import get_json, set_json
-from app.esi import esi_manager
+from app.esi import esi_async, esi_manager
 from app.config import settings
+from app.snapshots import store_snapshot
 
 WALLET_DIVISIONS_KEY = "wallet:divisions"
 WALLET_BALANCES_KEY = "wallet:balances"
 
 
-def get_wallet_divisions():
-    cached = get_json(WALLET_DIVISIONS_KEY)
+def wallet_balances_key(corporation_id: int) -> str:
+    return f"{WALLET_BALANCES_KEY}:{corporation_id}"
+
+
+def get_wallet_divisions(corporation_id: int):
+    cache_key = f"{WALLET_DIVISIONS_KEY}:{corporation_id}"
+    cached = get_json(cache_key)
     if cached:
         return cached
 
-    esi = esi_manager.get_client()
-    divisions = esi.get_op(
+    divisions = esi_async.run(esi_async.get_op(
         "get_corporations_corporation_id_divisions",
-        corporation_id=settings.corp_id,
-    )["wallet"]
-    set_json(WALLET_DIVISIONS_KEY, divisions, ex=24 * 60 * 60)
+        corporation_id=corporation_id,
+    ))["wallet"]
+    set_json(cache_key, divisions, ex=24 * 60 * 60)
     return divisions
 
 
-def get_wallet_balance():
-    cached = get_json(WALLET_BALANCES_KEY)
-    if cached:
-        return cached
-    return _fetch_wallet_balance()
-
-
-def _fetch_wallet_balance() -> dict[str, float]:
+def _fetch_wallet_balance(corporation_id: int) -> dict[str, float]:
     divisions: dict[str, float] = {}
 
-    for div in get_wallet_divisions():
+    # One wallets call returns every division's balance.
+    wallets = esi_async.run(esi_async.get_op(
+        "get_corporations_corporation_id_wallets",
+        corporation_id=corporation_id,
+    ))
+    for div in get_wallet_divisions(corporation_id):
         division = div["division"]
         name = div.get("name", "Master")
-        esi = esi_manager.get_client()
-        divisions[name] = esi.get_op(
-            "get_corporations_corporation_id_wallets",
-            corporation_id=settings.corp_id,
-        )[division - 1]["balance"]
-
-    set_json(
-        WALLET_BALANCES_KEY,
+        divisions[name] = wallets[division - 1]["balance"]
+
+    store_snapshot(
+        wallet_balances_key(corporation_id),
         divisions,
         ex=max(settings.wallet_refresh_seconds * 2, 60),
     )
     return divisions
 
 
-async def refresh_wallet_balances() -> dict[str, float]:
-    """Refresh wallet balances in the background."""
-    return await asyncio.to_thread(_fetch_wallet_balance)
+async def refresh_wallet_balances() -> dict[int, dict[str, float]]:
+    """Refresh every pooled corporation's wallet balances in parallel."""
+    corporation_ids = list(esi_manager.corporations())
+    balances = await asyncio.gather(
+        *(asyncio.to_thread(_fetch_wallet_balance, corporation_id) for corporation_id in corporation_ids)
+    )
+    return dict(zip(corporation_ids, balances))
@@ -0,0 +1,52 @@
+"""Compare two benchmark result files: python -m benchmarks.compare baseline.json candidate.json"""
+import argparse
+import json
+from typing import Any, Iterator
+
+# Results are timed in seconds; flag changes beyond this ratio.
+DEFAULT_THRESHOLD = 0.10
+
+
+def _medians(results: dict[str, Any], prefix: str = "") -> Iterator[tuple[str, float]]:
+    for name, value in results.items():
+        if not isinstance(value, dict):
+            if name == "cold" and isinstance(value, (int, float)):
+                yield prefix + name, value
+            continue
+        if value.get("unit") == "s" and "median" in value:
+            yield prefix + name, value["median"]
+        else:
+            yield from _medians(value, f"{prefix}{name}.")
+
+
+def compare(baseline: dict, candidate: dict, threshold: float = DEFAULT_THRESHOLD) -> list[tuple[str, float, float, str]]:
+    before = dict(_medians(baseline["results"]))
+    after = dict(_medians(candidate["results"]))
+    rows = []
+    for name in sorted(before.keys() & after.keys()):
+        ratio = after[name] / before[name] if before[name] else float("inf")
+        verdict = "slower" if ratio > 1 + threshold else "faster" if ratio < 1 - threshold else "same"
+        rows.append((name, before[name], after[name], verdict))
+    return rows
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    args = parser.parse_args()
+
+    with open(args.baseline, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    with open(args.candidate, "r", encoding="utf-8") as f:
+        candidate = json.load(f)
+
+    print(f"baseline  {baseline.get('commit')}\ncandidate {candidate.get('commit')}")
+    for name, before, after, verdict in compare(baseline, candidate, args.threshold):
+        change = (after / before - 1) * 100 if before else float("inf")
+        print(f"{name:45s} {before:10.4f}s -> {after:10.4f}s  {change:+7.1f}%  {verdict}")
+
+
+if __name__ == "__main__":
+    main()
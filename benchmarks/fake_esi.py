@@ -0,0 +1,210 @@
+import asyncio
+import hashlib
+import json
+import random
+import socket
+import threading
+import time
+from email.utils import formatdate
+from typing import Any, Optional
+
+import uvicorn
+from fastapi import FastAPI, Request, Response
+
+# ESI's error budget: this many 4xx/5xx responses per window before requests are refused.
+ERROR_LIMIT = 100
+ERROR_LIMIT_WINDOW = 60
+TRANSACTIONS_PAGE_SIZE = 2500
+
+
+class ErrorBudget:
+    def __init__(self):
+        self.remain = ERROR_LIMIT
+        self.window_start = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _roll(self) -> None:
+        if time.monotonic() - self.window_start >= ERROR_LIMIT_WINDOW:
+            self.window_start = time.monotonic()
+            self.remain = ERROR_LIMIT
+
+    def spend(self) -> None:
+        with self._lock:
+            self._roll()
+            self.remain = max(0, self.remain - 1)
+
+    def headers(self) -> dict[str, str]:
+        with self._lock:
+            self._roll()
+            reset = max(0, int(ERROR_LIMIT_WINDOW - (time.monotonic() - self.window_start)))
+            return {"X-ESI-Error-Limit-Remain": str(self.remain), "X-ESI-Error-Limit-Reset": str(reset)}
+
+
+def create_app(
+    fixtures: dict[str, Any],
+    latency_ms: float = 0,
+    jitter_ms: float = 0,
+    page_size: int = 1000,
+    expires_seconds: int = 0,
+    error_rate: float = 0,
+    seed: int = 0,
+) -> FastAPI:
+    """An ESI stand-in serving ``fixtures`` with ESI's paging, caching and error-limit headers.
+
+    Every response carries an ETag over its body and honours ``If-None-Match`` with a 304.
+    ``expires_seconds`` sets how long clients may reuse a response before revalidating.
+    """
+    app = FastAPI()
+    budget = ErrorBudget()
+    rng = random.Random(seed)
+    app.state.requests = {}
+    app.state.budget = budget
+
+    @app.middleware("http")
+    async def simulate_network(request: Request, call_next):
+        delay = latency_ms + rng.uniform(0, jitter_ms)
+        if delay:
+            await asyncio.sleep(delay / 1000)
+        if budget.remain == 0:
+            # ESI refuses everything with 420 until the window resets.
+            response = Response(json.dumps({"error": "error limited"}), status_code=420, media_type="application/json")
+        elif error_rate and rng.random() < error_rate:
+            response = Response(json.dumps({"error": "injected"}), status_code=502, media_type="application/json")
+        else:
+            response = await call_next(request)
+        route = request.scope.get("route")
+        name = route.name if route is not None else "unknown"
+        stats = app.state.requests.setdefault(name, {"count": 0, "not_modified": 0, "errors": 0})
+        stats["count"] += 1
+        if response.status_code == 304:
+            stats["not_modified"] += 1
+        elif response.status_code >= 400:
+            stats["errors"] += 1
+            if response.status_code != 420:
+                budget.spend()
+        response.headers.update(budget.headers())
+        return response
+
+    def respond(request: Request, payload: Any, pages: Optional[int] = None) -> Response:
+        body = json.dumps(payload).encode()
+        etag = f'"{hashlib.md5(body).hexdigest()}"'
+        headers = {
+            "ETag": etag,
+            "Expires": formatdate(time.time() + expires_seconds, usegmt=True),
+            "Last-Modified": formatdate(time.time(), usegmt=True),
+        }
+        if pages is not None:
+            headers["X-Pages"] = str(pages)
+        if request.headers.get("If-None-Match") == etag:
+            return Response(status_code=304, headers=headers)
+        return Response(body, media_type="application/json", headers=headers)
+
+    def paged(request: Request, rows: list, page: int, size: int) -> Response:
+        pages = max(1, -(-len(rows) // size))
+        if page > pages:
+            return Response(json.dumps({"error": "Requested page does not exist!"}), status_code=404)
+        return respond(request, rows[(page - 1) * size:page * size], pages)
+
+    def authorized(request: Request) -> bool:
+        return request.headers.get("Authorization", "").startswith("Bearer ")
+
+    def unauthorized() -> Response:
+        return Response(json.dumps({"error": "authentication required"}), status_code=401)
+
+    def region(region_id: int) -> dict:
+        return fixtures["regions"].get(str(region_id), {"orders": [], "history": {}})
+
+    @app.get("/markets/{region_id}/orders/", name="orders")
+    async def orders(request: Request, region_id: int, order_type: str = "all", page: int = 1):
+        rows = region(region_id)["orders"]
+        if order_type != "all":
+            rows = [row for row in rows if row["is_buy_order"] == (order_type == "buy")]
+        return paged(request, rows, page, page_size)
+
+    @app.get("/markets/{region_id}/history/", name="history")
+    async def history(request: Request, region_id: int, type_id: int):
+        rows = region(region_id)["history"].get(str(type_id))
+        if rows is None:
+            return Response(json.dumps({"error": "Type not found!"}), status_code=404)
+        return respond(request, rows)
+
+    @app.get("/characters/{character_id}/corporationhistory/", name="corporationhistory")
+    async def corporation_history(request: Request, character_id: str):
+        return respond(request, [
+            {"corporation_id": fixtures["corporation_id"], "record_id": 1, "start_date": "2020-01-01T00:00:00Z"}
+        ])
+
+    @app.get("/characters/{character_id}/skills/", name="skills")
+    async def skills(request: Request, character_id: str):
+        if not authorized(request):
+            return unauthorized()
+        return respond(request, {"skills": fixtures["skills"], "total_sp": 0})
+
+    @app.get("/corporations/{corporation_id}/blueprints/", name="blueprints")
+    async def blueprints(request: Request, corporation_id: int, page: int = 1):
+        if not authorized(request):
+            return unauthorized()
+        return paged(request, fixtures["corp_blueprints"], page, page_size)
+
+    @app.get("/corporations/{corporation_id}/divisions/", name="divisions")
+    async def divisions(request: Request, corporation_id: int):
+        if not authorized(request):
+            return unauthorized()
+        return respond(request, {"hangar": [], "wallet": fixtures["divisions"]})
+
+    @app.get("/corporations/{corporation_id}/wallets/", name="wallets")
+    async def wallets(request: Request, corporation_id: int):
+        if not authorized(request):
+            return unauthorized()
+        return respond(request, fixtures["balances"])
+
+    @app.get("/corporations/{corporation_id}/wallets/{division}/transactions/", name="transactions")
+    async def transactions(request: Request, corporation_id: int, division: int, from_id: Optional[int] = None):
+        if not authorized(request):
+            return unauthorized()
+        rows = fixtures["transactions"].get(str(division), [])
+        if from_id is not None:
+            # Strictly older than from_id, like ESI; rows are sorted newest first.
+            rows = [row for row in rows if row["transaction_id"] < from_id]
+        return respond(request, rows[:TRANSACTIONS_PAGE_SIZE])
+
+    return app
+
+
+class FakeEsiServer:
+    """Runs a fake ESI app with uvicorn on a background thread, bound to a free local port."""
+
+    def __init__(self, app: FastAPI, host: str = "127.0.0.1"):
+        self.app = app
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._socket.bind((host, 0))
+        self.url = f"http://{host}:{self._socket.getsockname()[1]}"
+        self._server = uvicorn.Server(uvicorn.Config(app, log_level="warning", access_log=False))
+        self._thread = threading.Thread(target=self._server.run, kwargs={"sockets": [self._socket]}, daemon=True)
+
+    def start(self) -> "FakeEsiServer":
+        self._thread.start()
+        deadline = time.monotonic() + 10
+        while not self._server.started:
+            if time.monotonic() > deadline:
+                raise RuntimeError("Fake ESI server did not start")
+            time.sleep(0.05)
+        return self
+
+    def stop(self) -> None:
+        self._server.should_exit = True
+        self._thread.join(timeout=10)
+        self._socket.close()
+
+    def request_stats(self) -> dict[str, dict[str, int]]:
+        return {name: dict(stats) for name, stats in self.app.state.requests.items()}
+
+    def reset_stats(self) -> None:
+        self.app.state.requests.clear()
+
+    def __enter__(self) -> "FakeEsiServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
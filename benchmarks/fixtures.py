@@ -0,0 +1,174 @@
+import json
+import os
+import random
+from datetime import datetime, timedelta, timezone
+from typing import Any
+
+# Type id ranges of the synthetic universe; disjoint so every id has one role.
+MATERIAL_BASE = 34
+SKILL_BASE = 3300
+PRODUCT_BASE = 100000
+BLUEPRINT_BASE = 200000
+TRANSACTION_BASE = 10_000_000_000
+
+CHARACTER_ID = "90000001"
+CORPORATION_ID = 98000001
+
+
+def generate_fixtures(
+    blueprints: int = 2000,
+    materials: int = 300,
+    skills: int = 40,
+    regions: tuple[int, ...] = (10000043,),
+    orders_per_type: int = 8,
+    history_days: int = 30,
+    divisions: int = 3,
+    transactions_per_division: int = 20000,
+    transaction_days: int = 30,
+    seed: int = 0,
+) -> dict[str, Any]:
+    """A deterministic ESI universe and matching SDE dump.
+
+    The result is plain JSON (string keys throughout) so it can be saved, edited and
+    replayed with ``save_fixtures``/``load_fixtures`` exactly like a recorded session.
+    """
+    rng = random.Random(seed)
+    now = datetime.now(timezone.utc)
+    today = now.date()
+
+    material_ids = [MATERIAL_BASE + i for i in range(materials)]
+    skill_ids = [SKILL_BASE + i for i in range(skills)]
+    material_prices = {type_id: round(rng.uniform(5, 5000), 2) for type_id in material_ids}
+
+    types = {str(type_id): f"Material {type_id}" for type_id in material_ids}
+    types.update({str(type_id): f"Skill {type_id}" for type_id in skill_ids})
+
+    sde_blueprints = []
+    product_prices = {}
+    for i in range(blueprints):
+        blueprint_id, product_id = BLUEPRINT_BASE + i, PRODUCT_BASE + i
+        types[str(blueprint_id)] = f"Product {product_id} Blueprint"
+        types[str(product_id)] = f"Product {product_id}"
+        bill = [
+            {"typeID": type_id, "quantity": rng.randint(1, 5000)}
+            for type_id in rng.sample(material_ids, rng.randint(2, 12))
+        ]
+        cost = sum(material_prices[m["typeID"]] * m["quantity"] for m in bill)
+        product_prices[product_id] = round(cost * rng.uniform(0.7, 1.8), 2)
+        sde_blueprints.append({
+            "blueprintTypeID": blueprint_id,
+            "activities": {"manufacturing": {
+                "materials": bill,
+                "products": [{"typeID": product_id, "quantity": 1}],
+                "skills": [
+                    {"typeID": type_id, "level": rng.randint(1, 5)}
+                    for type_id in rng.sample(skill_ids, rng.randint(1, 3))
+                ],
+                "time": rng.randint(60, 36000),
+            }},
+        })
+
+    region_data = {}
+    for region_id in regions:
+        orders = []
+        order_id = 6_000_000_000 + region_id * 1000
+        sell_prices = {**material_prices, **product_prices}
+        # Blueprints need a sell order to count as buildable from the market.
+        sell_prices.update({BLUEPRINT_BASE + i: 1_000_000.0 for i in range(blueprints)})
+        for type_id, price in sell_prices.items():
+            for _ in range(orders_per_type):
+                order_id += 1
+                is_buy = rng.random() < 0.4
+                orders.append({
+                    "order_id": order_id,
+                    "type_id": type_id,
+                    "is_buy_order": is_buy,
+                    "price": round(price * rng.uniform(0.8, 0.95) if is_buy else price * rng.uniform(1.0, 1.3), 2),
+                    "volume_remain": rng.randint(1, 1000),
+                    "location_id": 60003760,
+                })
+        rng.shuffle(orders)
+        history = {}
+        for product_id, price in product_prices.items():
+            history[str(product_id)] = [
+                {
+                    "date": (today - timedelta(days=day)).isoformat(),
+                    "average": round(price * rng.uniform(0.9, 1.1), 2),
+                    "highest": round(price * 1.2, 2),
+                    "lowest": round(price * 0.8, 2),
+                    "volume": rng.randint(0, 500),
+                    "order_count": rng.randint(1, 100),
+                }
+                # History ends yesterday, as ESI's does.
+                for day in range(history_days, 0, -1)
+            ]
+        region_data[str(region_id)] = {"orders": orders, "history": history}
+
+    transactions = {}
+    transaction_id = TRANSACTION_BASE
+    product_ids = list(product_prices)
+    span = timedelta(days=transaction_days).total_seconds()
+    for division in range(1, divisions + 1):
+        rows = []
+        for _ in range(transactions_per_division):
+            transaction_id += rng.randint(1, 3)
+            type_id = rng.choice(product_ids)
+            rows.append({
+                "transaction_id": transaction_id,
+                "date": (now - timedelta(seconds=rng.uniform(0, span))).strftime("%Y-%m-%dT%H:%M:%SZ"),
+                "type_id": type_id,
+                "quantity": rng.randint(1, 50),
+                "unit_price": product_prices[type_id],
+                "is_buy": rng.random() < 0.2,
+                "client_id": 90000000 + rng.randint(0, 999),
+                "location_id": 60003760,
+                "journal_ref_id": transaction_id,
+            })
+        # ESI lists the newest transaction first.
+        rows.sort(key=lambda row: row["transaction_id"], reverse=True)
+        transactions[str(division)] = rows
+
+    return {
+        "character_id": CHARACTER_ID,
+        "corporation_id": CORPORATION_ID,
+        "types": types,
+        "blueprints": sde_blueprints,
+        "skills": [
+            {"skill_id": type_id, "active_skill_level": 5, "trained_skill_level": 5, "skillpoints_in_skill": 256000}
+            for type_id in skill_ids
+            # Leave a few skills untrained so eligibility actually filters.
+            if rng.random() < 0.9
+        ],
+        "corp_blueprints": [
+            {"item_id": 1_000_000 + i, "type_id": BLUEPRINT_BASE + i, "location_id": 60003760,
+             "location_flag": "CorpSAG1", "material_efficiency": 10, "time_efficiency": 20,
+             "quantity": -2, "runs": -1}
+            for i in range(blueprints)
+            if rng.random() < 0.5
+        ],
+        "divisions": [{"division": d, "name": "Master" if d == 1 else f"Division {d}"} for d in range(1, divisions + 1)],
+        "balances": [{"division": d, "balance": round(rng.uniform(0, 1e10), 2)} for d in range(1, divisions + 1)],
+        "regions": region_data,
+        "transactions": transactions,
+    }
+
+
+def save_fixtures(fixtures: dict[str, Any], path: str) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(fixtures, f)
+
+
+def load_fixtures(path: str) -> dict[str, Any]:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def write_sde(fixtures: dict[str, Any], sde_dir: str) -> None:
+    """Write the fixture universe in the SDE's JSONL layout (types.jsonl, blueprints.jsonl)."""
+    os.makedirs(sde_dir, exist_ok=True)
+    with open(os.path.join(sde_dir, "types.jsonl"), "w", encoding="utf-8") as f:
+        for type_id, name in fixtures["types"].items():
+            f.write(json.dumps({"_key": int(type_id), "name": {"en": name}, "published": True}) + "\n")
+    with open(os.path.join(sde_dir, "blueprints.jsonl"), "w", encoding="utf-8") as f:
+        for blueprint in fixtures["blueprints"]:
+            f.write(json.dumps(blueprint) + "\n")
@@ -0,0 +1,272 @@
+"""Offline benchmarks against a fake ESI, a synthetic SDE and a scratch Redis database.
+
+    python -m benchmarks.run --out bench.json
+    python -m benchmarks.compare baseline.json bench.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from benchmarks.fake_esi import FakeEsiServer, create_app  # noqa: E402
+from benchmarks.fixtures import generate_fixtures, load_fixtures, save_fixtures, write_sde  # noqa: E402
+
+
+def summarize(samples: list[float]) -> dict[str, Any]:
+    ordered = sorted(samples)
+
+    def percentile(p: float) -> float:
+        return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+    return {
+        "unit": "s",
+        "samples": samples,
+        "min": ordered[0],
+        "median": statistics.median(ordered),
+        "mean": statistics.fmean(ordered),
+        "max": ordered[-1],
+        "stdev": statistics.stdev(ordered) if len(ordered) > 1 else 0.0,
+        "p95": percentile(95),
+        "p99": percentile(99),
+    }
+
+
+def timed(func: Callable[[], Any], repeat: int, before: Callable[[], None] | None = None) -> list[float]:
+    samples = []
+    for _ in range(repeat):
+        if before is not None:
+            before()
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def configure_environment(args: argparse.Namespace, workdir: str, esi_url: str, fixtures: dict) -> None:
+    """Point the app at the fake ESI and scratch stores; must run before ``app`` is imported."""
+    from cryptography.fernet import Fernet
+
+    os.environ.update({
+        "ESI_BASE_URL": esi_url,
+        "DATABASE_URL": f"sqlite:///{os.path.join(workdir, 'data', 'bench.db')}",
+        "REDIS_URL": args.redis_url,
+        "CORP_ID": str(fixtures["corporation_id"]),
+        "REGION_IDS": json.dumps([int(region) for region in fixtures["regions"]]),
+        "LEADER_ELECTION": "false",
+        "EVE_CLIENT_ID": os.environ.get("EVE_CLIENT_ID", "bench"),
+        "EVE_CLIENT_SECRET": os.environ.get("EVE_CLIENT_SECRET", "bench"),
+        "REFRESH_TOKEN_SECRET": Fernet.generate_key().decode(),
+    })
+    # SDE, parsed index and archive paths are relative to the working directory.
+    os.chdir(workdir)
+
+
+def register_principal(fixtures: dict) -> None:
+    """Pool the fixture character with a long-lived access token the fake ESI accepts."""
+    from app.esi import esi_manager
+
+    client = esi_manager._create_client("bench-refresh-token")
+    client.access_token = "bench-access-token"
+    client.access_expiration = time.time() + 365 * 24 * 60 * 60
+    esi_manager._add_client(fixtures["character_id"], client)
+
+
+def reset_sales_state() -> None:
+    from sqlalchemy import delete
+
+    from app.archive import ARCHIVE_DIR
+    from app.db import engine
+    from app.models.transaction import CorpIngestCursor, CorpSalesDaily, CorpTransaction
+
+    with engine.begin() as conn:
+        for model in (CorpTransaction, CorpSalesDaily, CorpIngestCursor):
+            conn.execute(delete(model))
+    shutil.rmtree(ARCHIVE_DIR, ignore_errors=True)
+
+
+async def scrape_metrics(concurrency: int, requests_per_client: int) -> tuple[list[float], float]:
+    import httpx
+
+    from app.main import app
+
+    latencies: list[float] = []
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        (await client.get("/metrics/")).raise_for_status()
+
+        async def scraper() -> None:
+            for _ in range(requests_per_client):
+                start = time.perf_counter()
+                response = await client.get("/metrics/", headers={"Accept-Encoding": "gzip"})
+                response.raise_for_status()
+                latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(scraper() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+    return latencies, elapsed
+
+
+def run_benchmarks(args: argparse.Namespace, server: FakeEsiServer) -> dict[str, Any]:
+    import redis
+
+    redis.Redis.from_url(args.redis_url).flushdb()
+
+    from app import sde
+    from app.main import refresh_profit_data
+    from app.orderbook import order_books
+    from app.sales import ingest_corp_sales
+
+    register_principal(args.fixtures)
+    results: dict[str, Any] = {}
+
+    print("[BENCH] _parse_sde_raw_items", flush=True)
+    results["parse_sde_raw_items"] = summarize(timed(sde._parse_sde_raw_items, args.repeat))
+
+    def refresh_profit() -> None:
+        asyncio.run(refresh_profit_data())
+
+    def drop_order_books() -> None:
+        # Each cycle re-sweeps the books (revalidated with ETags) as a daily refresh would.
+        for region_id in args.fixtures["regions"]:
+            order_books.invalidate(int(region_id))
+
+    print("[BENCH] refresh_profit_data", flush=True)
+    server.reset_stats()
+    samples = timed(refresh_profit, args.repeat, before=drop_order_books)
+    # The first cycle is cold: SDE compile, full history download, empty ESI response cache.
+    results["refresh_profit_data"] = {
+        "cold": samples[0],
+        "warm": summarize(samples[1:]) if len(samples) > 1 else None,
+        "esi_requests": server.request_stats(),
+    }
+
+    print("[BENCH] ingest_corp_sales", flush=True)
+    server.reset_stats()
+    results["ingest_corp_sales"] = {
+        **summarize(timed(ingest_corp_sales, args.repeat, before=reset_sales_state)),
+        "backlog_rows": sum(len(rows) for rows in args.fixtures["transactions"].values()),
+        "esi_requests": server.request_stats(),
+    }
+    # With nothing new upstream, an ingest is just the first page of every division.
+    results["ingest_corp_sales_incremental"] = summarize(timed(ingest_corp_sales, args.repeat))
+
+    print("[BENCH] /metrics scrape", flush=True)
+    latencies, elapsed = asyncio.run(scrape_metrics(args.concurrency, args.scrapes))
+    results["metrics_scrape"] = {
+        **summarize(latencies),
+        "concurrency": args.concurrency,
+        "requests": len(latencies),
+        "requests_per_second": len(latencies) / elapsed if elapsed else None,
+    }
+    results["metrics_scrape"].pop("samples")
+    return results
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--out", default="bench.json", help="Where to write the JSON results")
+    parser.add_argument(
+        "--redis-url", default="redis://localhost:6379/15",
+        help="Scratch Redis database; it is FLUSHED before the run",
+    )
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per benchmark")
+    parser.add_argument("--fixtures", help="Replay a saved fixture file instead of generating one")
+    parser.add_argument("--save-fixtures", help="Save the generated fixtures here for later replay")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--blueprints", type=int, default=2000)
+    parser.add_argument("--regions", type=int, nargs="+", default=[10000043, 10000002])
+    parser.add_argument("--divisions", type=int, default=3)
+    parser.add_argument("--transactions", type=int, default=20000, help="Backlog rows per wallet division")
+    parser.add_argument("--latency-ms", type=float, default=20, help="Fake ESI latency per request")
+    parser.add_argument("--jitter-ms", type=float, default=10)
+    parser.add_argument("--page-size", type=int, default=1000, help="Rows per page of paged operations")
+    parser.add_argument("--expires-seconds", type=int, default=0, help="Expires horizon of fake ESI responses")
+    parser.add_argument("--error-rate", type=float, default=0, help="Fraction of requests answered with a 502")
+    parser.add_argument("--concurrency", type=int, default=16, help="Concurrent /metrics scrapers")
+    parser.add_argument("--scrapes", type=int, default=50, help="Scrapes per /metrics client")
+    parser.add_argument("--keep-workdir", action="store_true", help="Keep the temporary data directory")
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str] | None = None) -> None:
+    args = parse_args(argv)
+    out_path = os.path.abspath(args.out)
+    if args.fixtures:
+        args.fixtures = load_fixtures(args.fixtures)
+    else:
+        args.fixtures = generate_fixtures(
+            blueprints=args.blueprints,
+            regions=tuple(args.regions),
+            divisions=args.divisions,
+            transactions_per_division=args.transactions,
+            seed=args.seed,
+        )
+        if args.save_fixtures:
+            save_fixtures(args.fixtures, args.save_fixtures)
+
+    workdir = tempfile.mkdtemp(prefix="lumacorp-bench-")
+    write_sde(args.fixtures, os.path.join(workdir, "data", "sde"))
+    app = create_app(
+        args.fixtures,
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        page_size=args.page_size,
+        expires_seconds=args.expires_seconds,
+        error_rate=args.error_rate,
+        seed=args.seed,
+    )
+    try:
+        with FakeEsiServer(app) as server:
+            configure_environment(args, workdir, server.url, args.fixtures)
+            started_at = datetime.now(timezone.utc).isoformat()
+            results = run_benchmarks(args, server)
+    finally:
+        os.chdir(REPO_ROOT)
+        if not args.keep_workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "commit": git_commit(),
+        "started_at": started_at,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "params": {
+            key: value for key, value in vars(args).items()
+            if key not in ("fixtures", "out", "save_fixtures", "keep_workdir")
+        },
+        "fixtures": {
+            "character_id": args.fixtures["character_id"],
+            "blueprints": len(args.fixtures["blueprints"]),
+            "regions": {region: len(data["orders"]) for region, data in args.fixtures["regions"].items()},
+        },
+        "results": results,
+    }
+    with open(out_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"[BENCH] Results written to {out_path}", flush=True)
+
+
+if __name__ == "__main__":
+    main()